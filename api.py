@@ -1,30 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from contextlib import asynccontextmanager
 import os
 import json
+import asyncio
 
 # Set HuggingFace to offline mode before importing rag_engine
 os.environ.setdefault("HF_HUB_OFFLINE", "1")
 os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
 
-from rag_engine import RAGEngine
+import metrics
+from rag_engine import QUEUE_REJECTIONS, RAGEngine, RequestContext
+from scheduler import QueueFullError
+
+# SSE framing — chunks arriving within SSE_FLUSH_INTERVAL of the first one in
+# a batch share a frame (one JSON encode, one write), up to SSE_FLUSH_CHARS.
+# The first chunk of an answer is always sent straight away.
+SSE_FLUSH_INTERVAL = 0.05  # seconds; 0 = one frame per chunk
+SSE_FLUSH_CHARS = 256
 
 # Global RAG engine (initialized at startup)
 rag_engine: Optional[RAGEngine] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize RAG engine at server startup."""
+    """Start the RAG engine at server startup.
+
+    Components load in the background so the server answers /health (and
+    503s on /chat) straight away instead of after the models are up.
+    """
     global rag_engine
-    print("[API] Initializing RAG Engine...")
-    rag_engine = RAGEngine()
-    print(f"[API] RAG Engine ready: {rag_engine.status}")
+    print("[API] Initializing RAG Engine in the background — progress at /health")
+    rag_engine = RAGEngine(background=True)
     yield
     print("[API] Shutting down.")
+    await rag_engine.aclose()
 
 app = FastAPI(title="KRMAI API", lifespan=lifespan)
 
@@ -45,6 +58,7 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     history: Optional[List[ChatMessage]]=None
+    debug: bool = False  # include the request trace (also enabled by an X-Debug header)
     
 class SourceDoc(BaseModel):
     source: str
@@ -53,14 +67,29 @@ class SourceDoc(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceDoc]
+    tokens: Optional[Dict[str, int]] = None  # prompt token breakdown (None on cache hits)
+    degraded: bool = False  # LLM unavailable — answer is the retrieved source excerpts
+    timings: Optional[Dict[str, Any]] = None  # debug mode only: stages, prompt size, chunks, Ollama counters
 
 @app.get("/health")
 def health_check():
-    """Returns the status of the RAG engine components."""
-    return rag_engine.status
+    """Returns the status of the RAG engine components, cache, LLM queue and circuit breaker."""
+    return {
+        **rag_engine.status,
+        "components": rag_engine.components,
+        "startup_seconds": rag_engine.startup_seconds,
+        "cache": rag_engine.cache_stats(),
+        "queue": rag_engine.queue_stats(),
+        "breaker": rag_engine.breaker_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus metrics: per-stage latency histograms, TTFT, token throughput and counters."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """Processes a user message and returns the LLM response with sources."""
     if not rag_engine.status["ready"]:
         raise HTTPException(status_code=503, detail="RAG Engine is not ready. Check /health endpoint.")
@@ -70,7 +99,12 @@ def chat(request: ChatRequest):
     if request.history:
         history = [{"role": h.role, "content": h.content} for h in request.history]
     
-    result = rag_engine.query(request.message, history=history)
+    try:
+        result = await rag_engine.aquery(
+            request.message, history=history, client_id=_client_id(http_request)
+        )
+    except QueueFullError as e:
+        raise _too_busy(e)
     
     # If the response is just a string, it means an error occurred in query()
     if isinstance(result, str):
@@ -81,11 +115,13 @@ def chat(request: ChatRequest):
     
     sources_out = _extract_sources(source_docs)
             
-    return ChatResponse(answer=answer, sources=sources_out)
+    return ChatResponse(answer=answer, sources=sources_out, tokens=result.get("prompt_tokens"),
+                        degraded=result.get("degraded", False),
+                        timings=result.get("trace") if _debug(request, http_request) else None)
 
 
 @app.post("/chat/stream")
-def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, http_request: Request):
     """Streaming endpoint — sends tokens as Server-Sent Events for real-time display."""
     if not rag_engine.status["ready"]:
         raise HTTPException(status_code=503, detail="RAG Engine is not ready.")
@@ -94,16 +130,40 @@ def chat_stream(request: ChatRequest):
     if request.history:
         history = [{"role": h.role, "content": h.content} for h in request.history]
 
-    def event_generator():
-        for chunk in rag_engine.query_stream(request.message, history=history):
-            # Send each text chunk as an SSE data event
-            data = json.dumps({"type": "token", "content": chunk})
+    # Refuse now, while a 429 can still be sent — headers go out with the first event
+    client_id = _client_id(http_request)
+    try:
+        rag_engine.scheduler.check(client_id)
+    except QueueFullError as e:
+        QUEUE_REJECTIONS.inc()
+        raise _too_busy(e)
+
+    # Request-scoped: sources and token counts of *this* stream, not the last one
+    ctx = RequestContext(request.message, client_id=client_id)
+    debug = _debug(request, http_request)
+
+    async def event_generator():
+        try:
+            # Async generator — an idle connection waiting on Ollama holds no thread
+            stream = rag_engine.aquery_stream(request.message, history=history, context=ctx)
+            async for chunk in _coalesce(stream, SSE_FLUSH_INTERVAL, SSE_FLUSH_CHARS):
+                # Send each batch of text as an SSE data event
+                data = json.dumps({"type": "token", "content": chunk})
+                yield f"data: {data}\n\n"
+        except QueueFullError as e:
+            # The queue filled up between the check and generation
+            data = json.dumps({"type": "error", "detail": str(e), "retry_after": e.retry_after})
             yield f"data: {data}\n\n"
+            return
 
         # After streaming completes, send sources as a final event
-        source_docs = rag_engine.last_source_docs
-        sources_out = [{"source": s.source, "page": s.page} for s in _extract_sources(source_docs)]
-        data = json.dumps({"type": "done", "sources": sources_out})
+        sources_out = [{"source": s.source, "page": s.page}
+                       for s in _extract_sources(ctx.source_documents)]
+        done = {"type": "done", "sources": sources_out, "tokens": ctx.prompt_tokens,
+                "degraded": ctx.degraded}
+        if debug:
+            done["timings"] = ctx.trace()
+        data = json.dumps(done)
         yield f"data: {data}\n\n"
 
     return StreamingResponse(
@@ -117,6 +177,86 @@ def chat_stream(request: ChatRequest):
     )
 
 
+async def _coalesce(stream, interval: float, max_chars: int):
+    """Re-batch an async text stream into fewer, larger pieces.
+
+    The first chunk is yielded immediately (time to first token is what the
+    user notices); after that a batch is yielded `interval` seconds after its
+    first chunk arrived, or as soon as it holds `max_chars`. The next chunk
+    is awaited as a task, so a window closes on time even while the model is
+    silent. Text buffered when the stream fails is yielded before the error.
+    """
+    if interval <= 0:
+        async for chunk in stream:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer, size, deadline = [], 0, 0.0
+    first = True
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(stream.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                task, pending = pending, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    break
+                except BaseException:
+                    if buffer:
+                        yield "".join(buffer)
+                    raise
+                if first:
+                    first = False
+                    yield chunk
+                    continue
+                if not buffer:
+                    deadline = loop.time() + interval
+                buffer.append(chunk)
+                size += len(chunk)
+                if size < max_chars and loop.time() < deadline:
+                    continue
+            if buffer:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            # Client disconnected mid-wait: stop the generation rather than leak it
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        await stream.aclose()
+
+
+def _client_id(http_request: Request) -> str:
+    """Fair-queueing key: an explicit X-Client-ID header, else the caller's IP."""
+    client_id = http_request.headers.get("x-client-id")
+    if client_id:
+        return client_id[:64]
+    return http_request.client.host if http_request.client else "anonymous"
+
+
+def _debug(request: ChatRequest, http_request: Request) -> bool:
+    """Debug mode: {"debug": true} in the body or an X-Debug: 1 header."""
+    header = http_request.headers.get("x-debug", "").lower()
+    return request.debug or header in ("1", "true", "yes", "on")
+
+
+def _too_busy(error: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)}
+    )
+
+
 def _extract_sources(source_docs):
     """Extract unique sources from retrieved documents."""
     sources_out = []
@@ -1,19 +1,84 @@
 import os
+import json
+import asyncio
+import requests
 import streamlit as st
-from rag_engine import RAGEngine
+from rag_engine import RAGEngine, RequestContext
+from scheduler import QueueFullError
+
+# ── Config ─────────────────────────────────────────────────────
+# Set RAG_API_URL (e.g. http://localhost:8000) to use a running api.py instead
+# of loading the models into this process — the app is then a thin client.
+API_URL = os.environ.get("RAG_API_URL", "").rstrip("/")
+API_TIMEOUT = 120  # seconds without a byte from the API before giving up
 
 # ── Page config ────────────────────────────────────────────────
 st.set_page_config(page_title="College Knowledge Retrieval", page_icon="📚", layout="wide")
 
+
+# ── Engine ─────────────────────────────────────────────────────
+# One engine per Streamlit process, shared by every browser session: the
+# engine keeps no per-user state, so sessions only differ in their history.
+@st.cache_resource(show_spinner="Loading RAG engine (first launch may download embeddings)...")
+def get_engine() -> RAGEngine:
+    return RAGEngine()
+
+
+def reload_engine():
+    """Drop the shared engine; the next run builds a new one (for all sessions)."""
+    engine = get_engine()
+    get_engine.clear()
+    asyncio.run(engine.aclose())  # stop its health monitor and thread pool
+
+
+def stream_local(question: str, history: list, result: dict):
+    """Yield answer chunks from the in-process engine; fills result["sources"]."""
+    ctx = RequestContext(question)
+    yield from get_engine().query_stream(question, history=history, context=ctx)
+    result["sources"] = [
+        (doc.metadata.get("source", "Unknown"), doc.metadata.get("page", "N/A"))
+        for doc in ctx.source_documents
+    ]
+
+
+def stream_remote(question: str, history: list, result: dict):
+    """Yield answer chunks from api.py's /chat/stream; fills result["sources"]."""
+    body = {"message": question, "history": history}
+    with requests.post(f"{API_URL}/chat/stream", json=body, stream=True, timeout=API_TIMEOUT) as r:
+        if r.status_code == 429:
+            raise QueueFullError(r.json().get("detail", "Server busy"),
+                                 int(r.headers.get("Retry-After", 1)))
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                raise QueueFullError(event["detail"], event.get("retry_after", 1))
+            elif event["type"] == "done":
+                result["sources"] = [(s["source"], s.get("page") or "N/A") for s in event["sources"]]
+
+
+def format_sources(sources) -> str:
+    lines, seen = [], set()
+    for src, page in sources:
+        key = f"{src}-{page}"
+        if key not in seen:
+            seen.add(key)
+            lines.append(f"- *{src}* (Page {page})")
+    return "\n\n---\n**📄 Sources:**\n" + "\n".join(lines) if lines else ""
+
+
 # ── Session state ──────────────────────────────────────────────
+# Each message keeps the plain answer separately from the displayed text
+# (answer + sources), so only the answer is sent back as history.
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "rag_engine" not in st.session_state:
-    with st.spinner("Loading RAG engine (first launch may download embeddings)..."):
-        st.session_state.rag_engine = RAGEngine()
-
-engine: RAGEngine = st.session_state.rag_engine
+if not API_URL:
+    get_engine()
 
 # ── Sidebar ────────────────────────────────────────────────────
 with st.sidebar:
@@ -22,10 +87,12 @@ with st.sidebar:
 
     st.subheader("Welcome!")
     st.markdown("Ask questions about college documents, rules, regulations, and placement criteria.")
-    
+
     st.markdown("---")
-    if st.button("🔄 Reload Engine"):
-        st.session_state.rag_engine = RAGEngine()
+    if API_URL:
+        st.caption(f"Connected to {API_URL}")
+    elif st.button("🔄 Reload Engine"):
+        reload_engine()
         st.rerun()
 
 # ── Main chat ──────────────────────────────────────────────────
@@ -35,40 +102,32 @@ st.caption("Ask questions about college documents — answers are grounded in up
 # Display chat history
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+        st.markdown(msg["display"])
 
 # User input
 if prompt := st.chat_input("Ask a question about college documents..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    # The engine is stateless — send the conversation so far with each question
+    history = [{"role": m["role"], "content": m["content"]} for m in st.session_state.messages]
+    st.session_state.messages.append({"role": "user", "content": prompt, "display": prompt})
     with st.chat_message("user"):
-        
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
         placeholder = st.empty()
-        with st.spinner("Searching documents and thinking..."):
-            result = engine.query(prompt)
-
-            if isinstance(result, str):
-                full_response = result
-            else:
-                answer = result["answer"]
-                sources = result.get("source_documents", [])
-
-                full_response = answer
-
-                if sources:
-                    full_response += "\n\n---\n**📄 Sources:**\n"
-                    seen = set()
-                    for doc in sources:
-                        src = doc.metadata.get("source", "Unknown")
-                        page = doc.metadata.get("page", "N/A")
-                        key = f"{src}-{page}"
-                        if key not in seen:
-                            seen.add(key)
-                            full_response += f"- *{src}* (Page {page})\n"
-
+        placeholder.markdown("_Searching documents..._")
+        result = {"sources": []}
+        stream = stream_remote if API_URL else stream_local
+        answer = ""
+        try:
+            for chunk in stream(prompt, history, result):
+                answer += chunk
+                placeholder.markdown(answer + "▌")
+        except QueueFullError as e:
+            answer += f"\n\n⚠️ {e} Please try again in {e.retry_after}s."
+        except requests.RequestException as e:
+            answer += f"\n\n⚠️ Could not reach the API at {API_URL}: {e}"
+
+        full_response = answer + format_sources(result["sources"])
         placeholder.markdown(full_response)
 
-
-    st.session_state.messages.append({"role": "assistant", "content": full_response})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": answer, "display": full_response})
@@ -0,0 +1,130 @@
+"""
+Hybrid Retrieval Weight Benchmark
+=================================
+Runs the test_system.py questions through RAGEngine's hybrid retriever for a
+range of dense/lexical fusion weights and reports how many of each test's
+expected keywords appear in the retrieved context, plus BM25 lookup latency.
+No LLM is needed — only chroma_db/, the BM25 index built by ingest.py and the
+embedding model (the dense ranking is only meaningful with the real one).
+
+The best pair is printed last; ties go to the weights configured in
+rag_engine.py, so changing them takes a measured gain. Save the run with
+--output and set HYBRID_DENSE_WEIGHT / HYBRID_LEXICAL_WEIGHT from it.
+
+Usage:
+    python ingest.py
+    python benchmarks/bench_hybrid.py --output evaluation/hybrid_results.json
+    python benchmarks/bench_hybrid.py --weights 1:0,1:0.5,1:1,0.5:1,0:1
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import rag_engine  # noqa: E402
+from rag_engine import RAGEngine, _expand_slang, _format_docs  # noqa: E402
+from bench_load import git_commit  # noqa: E402
+
+# (question, expected keywords) — questions from test_system.py, with its
+# keyword checks where it has them
+CASES = [
+    ("What are the bus routes available at KR Mangalam University?", ["bus", "route", "campus"]),
+    ("Tell me about placements at KRMU. What is the highest package?", ["placement", "56.6", "lpa"]),
+    ("Who are the top placed students at KR Mangalam University?", ["rishav", "vineet", "ferrari", "autodesk"]),
+    ("What is the fee structure for BTech CSE?", ["fee", "btech", "cse"]),
+    ("What are the hostel facilities at KRMU?", ["hostel", "room"]),
+    ("How can I apply for scholarships at KR Mangalam University?", ["scholarship"]),
+    ("What is the anti-ragging policy at KRMU?", ["ragging", "policy"]),
+    ("What facilities are available on campus?", ["campus", "facilit"]),
+    ("Tell me about bus routes, timings, placements, top placed students and average package",
+     ["bus", "route", "placement", "package"]),
+    ("What are the fees and hostel charges for BTech CSE students?", ["fee", "hostel"]),
+    ("bhai placement kaisa hai krmu mein?", ["placement"]),
+    ("yo whats the fee structure fr fr", ["fee"]),
+    ("hostel ki fees kitni hai?", ["hostel", "fee"]),
+    ("What is the highest placement package?", ["placement", "package"]),
+]
+
+# (dense weight, lexical weight)
+WEIGHTS = [(1.0, 0.0), (0.0, 1.0), (1.0, 0.5), (1.0, 1.0), (0.5, 1.0)]
+
+
+def weight_pairs(value):
+    """"1:0.5,0.5:1" -> [(1.0, 0.5), (0.5, 1.0)]"""
+    return [tuple(float(w) for w in pair.split(":")) for pair in value.split(",") if pair.strip()]
+
+
+def keyword_recall(engine, question, keywords):
+    cleaned = _expand_slang(question)
+    embedding = engine.retrieval_cache.embed_query(cleaned)
+    docs, _ = engine.hybrid_retriever.search(cleaned, embedding)
+    context = _format_docs(docs).lower()
+    return sum(kw in context for kw in keywords) / len(keywords)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--weights", type=weight_pairs, default=WEIGHTS,
+                        help="dense:lexical pairs to sweep, e.g. 1:0.5,1:1")
+    parser.add_argument("--output", help="also save the results as JSON")
+    args = parser.parse_args()
+
+    print(f"{'=' * 60}")
+    print("  Hybrid Retrieval Benchmark")
+    print(f"{'=' * 60}")
+    engine = RAGEngine()
+    if not engine.hybrid_retriever:
+        print("  [-] Vector store not loaded — run 'python ingest.py' first.")
+        sys.exit(1)
+    retriever = engine.hybrid_retriever
+    bm25 = retriever._load_index()
+    if bm25 is None:
+        print("  [!] No BM25 index — only the dense row is meaningful.")
+
+    current = (rag_engine.HYBRID_DENSE_WEIGHT, rag_engine.HYBRID_LEXICAL_WEIGHT)
+    print(f"\n  {'dense':>6} {'lexical':>8}   keyword recall   all keywords")
+    rows = []
+    for dense_w, lexical_w in args.weights:
+        retriever.dense_weight, retriever.lexical_weight = dense_w, lexical_w
+        recall = [keyword_recall(engine, q, kws) for q, kws in CASES]
+        mean = sum(recall) / len(recall)
+        complete = sum(r == 1 for r in recall)
+        print(f"  {dense_w:>6.1f} {lexical_w:>8.1f}   {mean:>14.1%}   {complete:>5}/{len(CASES)}")
+        rows.append({"dense_weight": dense_w, "lexical_weight": lexical_w,
+                     "keyword_recall": round(mean, 4), "all_keywords": complete,
+                     "per_case": [round(r, 4) for r in recall]})
+    retriever.dense_weight, retriever.lexical_weight = current
+
+    best = max(rows, key=lambda r: (r["keyword_recall"], r["all_keywords"],
+                                    (r["dense_weight"], r["lexical_weight"]) == current))
+    print(f"\n  Best: dense {best['dense_weight']:.1f}, lexical {best['lexical_weight']:.1f} "
+          f"(configured: dense {current[0]:.1f}, lexical {current[1]:.1f})")
+
+    if bm25 is not None:
+        queries = [_expand_slang(q) for q, _ in CASES]
+        iterations = 200
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for q in queries:
+                bm25.search(q, 20)
+        per_query = (time.perf_counter() - start) / (iterations * len(queries))
+        print(f"\n  BM25 lookup: {per_query * 1e6:.0f} us/query over {len(bm25.doc_ids)} chunks")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "embedding_model": rag_engine.EMBEDDING_MODEL,
+                       "bm25_index": bm25 is not None, "configured": list(current),
+                       "best": [best["dense_weight"], best["lexical_weight"]],
+                       "cases": [q for q, _ in CASES], "results": rows}, f, indent=2)
+        print(f"\n  Results saved to: {args.output}")
+    print(f"{'=' * 60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+API Load Benchmark
+==================
+Drives POST /chat and POST /chat/stream at a fixed concurrency (closed loop:
+N clients, each sending its next question when the last one is answered) or
+at a fixed arrival rate (open loop: Poisson arrivals, whatever the backlog),
+and reports latency p50/p95/p99, time-to-first-token, throughput and error
+rate. Results are saved as JSON in the style of evaluation/test_results.json
+(one entry per endpoint, plus the commit they were measured on), so
+regressions show up between commits.
+
+--local needs no Ollama and no running API: it starts fake_ollama.py and the
+API in this process, with the response and semantic caches disabled so every
+request reaches the (fake) LLM. chroma_db/ and the embedding model are still
+used for real. Client and server share one process, so compare --local runs
+with each other rather than reading them as capacity figures.
+
+Usage:
+    python benchmarks/bench_load.py --local
+    python benchmarks/bench_load.py --local --rate 2 --requests 60 --endpoint stream
+    python benchmarks/bench_load.py --url http://localhost:8000 --concurrency 8
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_ollama import FakeOllama  # noqa: E402
+
+DEFAULT_OUTPUT = os.path.join(ROOT_DIR, "evaluation", "load_results.json")
+ENDPOINTS = {"chat": "/chat", "stream": "/chat/stream"}
+READY_TIMEOUT = 300  # seconds to wait for /health to report ready
+
+QUESTIONS = [
+    "What is the fee structure for BTech CSE?",
+    "What are the hostel facilities at KRMU?",
+    "Tell me about placements at KRMU. What is the highest package?",
+    "What are the bus routes available at KR Mangalam University?",
+    "How can I apply for scholarships at KR Mangalam University?",
+    "What is the anti-ragging policy at KRMU?",
+    "What facilities are available on campus?",
+    "bhai placement kaisa hai krmu mein?",
+]
+
+
+# ── Requests ───────────────────────────────────────────────────
+async def send_chat(client, question, client_id):
+    """POST /chat. Returns a sample dict (latency, ttft, tokens, error)."""
+    start = time.perf_counter()
+    try:
+        r = await client.post("/chat", json={"message": question},
+                              headers={"X-Client-ID": client_id})
+        latency = time.perf_counter() - start
+        if r.status_code != 200:
+            return {"latency": latency, "error": f"HTTP {r.status_code}"}
+        return {"latency": latency, "ttft": None, "tokens": 0, "error": None}
+    except httpx.HTTPError as e:
+        return {"latency": time.perf_counter() - start, "error": type(e).__name__}
+
+
+async def send_stream(client, question, client_id):
+    """POST /chat/stream and read the SSE events up to "done"."""
+    start = time.perf_counter()
+    ttft, tokens = None, 0
+    try:
+        async with client.stream("POST", "/chat/stream", json={"message": question},
+                                 headers={"X-Client-ID": client_id}) as r:
+            if r.status_code != 200:
+                return {"latency": time.perf_counter() - start, "error": f"HTTP {r.status_code}"}
+            async for line in r.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event["type"] == "token":
+                    tokens += 1
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                elif event["type"] == "error":
+                    return {"latency": time.perf_counter() - start, "error": "SSE error"}
+                elif event["type"] == "done":
+                    return {"latency": time.perf_counter() - start, "ttft": ttft,
+                            "tokens": tokens, "error": None}
+        return {"latency": time.perf_counter() - start, "error": "no done event"}
+    except httpx.HTTPError as e:
+        return {"latency": time.perf_counter() - start, "error": type(e).__name__}
+
+
+SENDERS = {"chat": send_chat, "stream": send_stream}
+
+
+# ── Load patterns ──────────────────────────────────────────────
+def question_for(i, unique):
+    question = QUESTIONS[i % len(QUESTIONS)]
+    # A distinct suffix defeats the exact-match cache and request coalescing
+    return f"{question} (load test {i})" if unique else question
+
+
+async def closed_loop(send, client, total, concurrency, unique):
+    """`concurrency` clients, each sending its next request as soon as the last returns."""
+    samples, counter = [], iter(range(total))
+
+    async def worker(w):
+        for i in counter:
+            samples.append(await send(client, question_for(i, unique), f"load-{w}"))
+
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return samples
+
+
+async def open_loop(send, client, total, rate, unique, seed=0):
+    """Requests arrive at `rate`/s on average (Poisson), however many are still running."""
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(total):
+        tasks.append(asyncio.create_task(send(client, question_for(i, unique), f"load-{i}")))
+        await asyncio.sleep(rng.expovariate(rate))
+    return await asyncio.gather(*tasks)
+
+
+# ── Report ─────────────────────────────────────────────────────
+def percentile(values, p):
+    """Nearest-rank percentile of a list (None if empty)."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(samples, wall):
+    ok = [s for s in samples if not s["error"]]
+    latencies = [s["latency"] for s in ok]
+    ttfts = [s["ttft"] for s in ok if s.get("ttft") is not None]
+    errors = {}
+    for s in samples:
+        if s["error"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+
+    latency = {f"p{p}": rounded(percentile(latencies, p)) for p in (50, 95, 99)}
+    latency["mean"] = rounded(sum(latencies) / len(latencies)) if latencies else None
+    latency["max"] = rounded(max(latencies, default=None))
+    return {
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "stream_tokens_per_second": round(sum(s.get("tokens", 0) for s in ok) / wall, 1) if wall else 0.0,
+        "latency_s": latency,
+        "ttft_s": {f"p{p}": rounded(percentile(ttfts, p)) for p in (50, 95, 99)},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ── Local stack ────────────────────────────────────────────────
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_stack(args):
+    """Fake Ollama + the API (uvicorn on a thread) in this process. Returns the API URL."""
+    fake = FakeOllama(port=0, prefill=args.prefill, tps=args.tps, tokens=args.tokens,
+                      parallel=args.parallel).start()
+    print(f"  Fake Ollama  : {fake.url} (prefill {args.prefill}s, {args.tps} tok/s, "
+          f"{args.tokens} tokens)")
+
+    import rag_engine
+    rag_engine.OLLAMA_BASE_URL = fake.url
+    rag_engine.RESPONSE_CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_load_"),
+                                                  "response_cache.sqlite3")
+    if not args.cache:
+        rag_engine.RESPONSE_CACHE_MAX_BYTES = 0  # every answer is evicted right away
+        rag_engine.SEMANTIC_CACHE_SIZE = 0
+
+    import api
+    import uvicorn
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-api", daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    print(f"  API          : {url} (in-process)")
+    return url
+
+
+def wait_ready(url):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            health = httpx.get(f"{url}/health", timeout=5).json()
+            if health.get("ready"):
+                return True
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+# ── Main ───────────────────────────────────────────────────────
+async def run(args, url):
+    results = []
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        for name in (["chat", "stream"] if args.endpoint == "both" else [args.endpoint]):
+            send = SENDERS[name]
+            for i in range(args.warmup):  # cold caches, tokenizer, connections — not measured
+                await send(client, question_for(i, args.unique), "warmup")
+            if args.rate:
+                load = f"rate {args.rate}/s"
+                start = time.perf_counter()
+                samples = await open_loop(send, client, args.requests, args.rate, args.unique)
+            else:
+                load = f"concurrency {args.concurrency}"
+                start = time.perf_counter()
+                samples = await closed_loop(send, client, args.requests, args.concurrency, args.unique)
+            metrics = summarize(samples, time.perf_counter() - start)
+            latency, ttft = metrics["latency_s"], metrics["ttft_s"]
+            details = (f"{metrics['succeeded']}/{metrics['requests']} ok, "
+                       f"p50 {latency['p50']}s, p95 {latency['p95']}s, p99 {latency['p99']}s, "
+                       f"{metrics['throughput_rps']} req/s")
+            if ttft["p50"] is not None:
+                details += f", TTFT p50 {ttft['p50']}s"
+            passed = metrics["error_rate"] <= args.max_error_rate
+            print(f"  [{'+' if passed else '-'}] POST {ENDPOINTS[name]} ({load}): {details}")
+            if metrics["errors"]:
+                print(f"      errors: {metrics['errors']}")
+            results.append({
+                "name": f"POST {ENDPOINTS[name]} ({load})",
+                "category": "Load",
+                "passed": passed,
+                "duration": metrics["wall_seconds"],
+                "details": details,
+                "metrics": metrics,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://localhost:8000", help="API to test (ignored with --local)")
+    parser.add_argument("--local", action="store_true", help="start fake Ollama + API in-process")
+    parser.add_argument("--endpoint", choices=["chat", "stream", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=40, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed-loop clients")
+    parser.add_argument("--rate", type=float, default=0, help="open-loop arrivals/s (overrides --concurrency)")
+    parser.add_argument("--unique", action="store_true",
+                        help="make every question distinct (no exact-cache hits or coalescing)")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured requests per endpoint")
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout (s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="pass threshold")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    local = parser.add_argument_group("--local options")
+    local.add_argument("--prefill", type=float, default=0.5, help="fake prompt evaluation (s)")
+    local.add_argument("--tps", type=float, default=20.0, help="fake tokens per second")
+    local.add_argument("--tokens", type=int, default=60, help="fake tokens per answer")
+    local.add_argument("--parallel", type=int, default=1, help="fake concurrent generations")
+    local.add_argument("--cache", action="store_true", help="keep the response/semantic caches on")
+    args = parser.parse_args()
+
+    print(f"{'=' * 60}")
+    print("  API Load Benchmark")
+    print(f"{'=' * 60}")
+    url = start_local_stack(args) if args.local else args.url
+    if not wait_ready(url):
+        print(f"  [-] API at {url} not ready after {READY_TIMEOUT}s — check /health")
+        sys.exit(1)
+
+    results = asyncio.run(run(args, url))
+    config = {
+        "commit": git_commit(),
+        "url": "local" if args.local else url,
+        "requests": args.requests,
+        "concurrency": None if args.rate else args.concurrency,
+        "rate": args.rate or None,
+        "unique": args.unique,
+        "warmup": args.warmup,
+    }
+    if args.local:
+        config.update(prefill=args.prefill, tps=args.tps, tokens=args.tokens,
+                      parallel=args.parallel, cache=args.cache)
+    for entry in results:
+        entry["config"] = config
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n  Results saved to: {args.output}")
+    print(f"{'=' * 60}")
+    sys.exit(0 if all(r["passed"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Retrieval Quality & Latency Benchmark
+=====================================
+Runs a labeled question -> expected-source set (benchmarks/retrieval_set.json,
+seeded from the test_system.py bus, fee, hostel, placement, scholarship and
+anti-ragging tests) through RAGEngine's hybrid retriever and reports, per
+configuration:
+
+  hit@k     share of questions with at least one expected file in the top k
+  recall@k  share of each question's expected files found in the top k
+  MRR       mean of 1 / rank of the first chunk from an expected file
+  latency   per-query embedding and search time (p50/p95, caches off)
+
+No LLM is needed. Without sweep options it scores the current chroma_db/;
+--chunk-sizes / --overlaps build a temporary index from data/ for every
+combination (chroma_db/ is not touched), and --k scores each at several k.
+
+Usage:
+    python benchmarks/bench_retrieval.py
+    python benchmarks/bench_retrieval.py --k 2,4,6
+    python benchmarks/bench_retrieval.py --chunk-sizes 800,1500 --overlaps 150,300 --k 4,6
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import rag_engine  # noqa: E402
+from rag_engine import RAGEngine, _expand_slang  # noqa: E402
+
+DEFAULT_CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_set.json")
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def current_settings():
+    """(chunk size, overlap) chroma_db/ was built with, from ingest's manifest."""
+    try:
+        with open(os.path.join(rag_engine.CHROMA_PATH, ingest.MANIFEST_FILE)) as f:
+            settings = json.load(f)["settings"]
+        return settings["chunk_size"], settings["chunk_overlap"]
+    except (OSError, ValueError, KeyError):
+        return ingest.CHUNK_SIZE, ingest.CHUNK_OVERLAP
+
+
+def build_index(path, chunk_size, overlap):
+    """Ingest data/ into a fresh Chroma + BM25 index at `path`; returns the chunk count."""
+    saved = ingest.CHROMA_PATH, ingest.CHUNK_SIZE, ingest.CHUNK_OVERLAP
+    ingest.CHROMA_PATH, ingest.CHUNK_SIZE, ingest.CHUNK_OVERLAP = path, chunk_size, overlap
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # per-file progress lines
+            stats = ingest.sync_vector_store(ingest.DATA_DIR, full_rebuild=True)
+    finally:
+        ingest.CHROMA_PATH, ingest.CHUNK_SIZE, ingest.CHUNK_OVERLAP = saved
+    return stats["chunks_updated"]
+
+
+def open_index(engine, embeddings, path):
+    """Point the engine's retrieval stack at the index in `path`."""
+    from langchain_chroma import Chroma
+    rag_engine.CHROMA_PATH = path
+    engine._build_retrieval(embeddings, Chroma(persist_directory=path, embedding_function=embeddings))
+    return engine.hybrid_retriever
+
+
+def evaluate(retriever, embeddings, cases, k):
+    """Score one retriever configuration. Returns (summary, per-question rows)."""
+    retriever.k = k
+    rows, embed_ms, search_ms = [], [], []
+    for case in cases:
+        expected = set(case["expected_sources"])
+        cleaned = _expand_slang(case["question"])
+        start = time.perf_counter()
+        embedding = embeddings.embed_query(cleaned)  # the model itself, not the query cache
+        embedded = time.perf_counter()
+        docs, _ = retriever.search(cleaned, embedding)
+        searched = time.perf_counter()
+        embed_ms.append((embedded - start) * 1000)
+        search_ms.append((searched - embedded) * 1000)
+
+        sources = [doc.metadata.get("source", "Unknown") for doc in docs[:k]]
+        first = next((rank for rank, src in enumerate(sources, start=1) if src in expected), None)
+        rows.append({
+            "question": case["question"],
+            "retrieved": sources,
+            "recall": len(expected & set(sources)) / len(expected),
+            "reciprocal_rank": 1 / first if first else 0.0,
+        })
+
+    n = len(rows)
+    return {
+        "k": k,
+        "hit_at_k": round(sum(r["recall"] > 0 for r in rows) / n, 4),
+        "recall_at_k": round(sum(r["recall"] for r in rows) / n, 4),
+        "mrr": round(sum(r["reciprocal_rank"] for r in rows) / n, 4),
+        "embed_ms_p50": round(percentile(embed_ms, 50), 2),
+        "embed_ms_p95": round(percentile(embed_ms, 95), 2),
+        "search_ms_p50": round(percentile(search_ms, 50), 2),
+        "search_ms_p95": round(percentile(search_ms, 95), 2),
+    }, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cases", default=DEFAULT_CASES, help="labeled question set (JSON)")
+    parser.add_argument("--k", type=int_list, default=[rag_engine.RETRIEVAL_K], help="e.g. 2,4,6")
+    parser.add_argument("--chunk-sizes", type=int_list, help="sweep: build an index per size")
+    parser.add_argument("--overlaps", type=int_list, help=f"sweep overlaps (default {ingest.CHUNK_OVERLAP})")
+    parser.add_argument("--embedding-model", help=f"instead of {rag_engine.EMBEDDING_MODEL} (sweeps only)")
+    parser.add_argument("--verbose", action="store_true", help="list questions with misses")
+    parser.add_argument("--output", help="also save the results as JSON")
+    args = parser.parse_args()
+
+    with open(args.cases) as f:
+        cases = json.load(f)
+    sweep = args.chunk_sizes or args.overlaps or args.embedding_model
+    if args.embedding_model:
+        rag_engine.EMBEDDING_MODEL = ingest.EMBEDDING_MODEL = args.embedding_model
+
+    print(f"{'=' * 78}")
+    print("  Retrieval Benchmark")
+    print(f"{'=' * 78}")
+    # Retrieval only: no LLM, no background threads, and no caches skewing latency
+    rag_engine.WARMUP_ON_START = False
+    rag_engine.OLLAMA_MONITOR_INTERVAL = 0
+    rag_engine.RETRIEVAL_CACHE_SIZE = 0
+    engine = RAGEngine()
+    embeddings = engine.embeddings or engine._load_embeddings()
+    if embeddings is None:
+        print("  [-] Embedding model could not be loaded.")
+        sys.exit(1)
+
+    if sweep:
+        configs = [(size, overlap)
+                   for size in (args.chunk_sizes or [ingest.CHUNK_SIZE])
+                   for overlap in (args.overlaps or [ingest.CHUNK_OVERLAP])
+                   if overlap < size]
+    else:
+        if not engine.hybrid_retriever:
+            print("  [-] Vector store not loaded — run 'python ingest.py' first.")
+            sys.exit(1)
+        configs = [current_settings()]
+    print(f"  {len(cases)} questions, model {rag_engine.EMBEDDING_MODEL}"
+          f"{', temporary indexes from data/' if sweep else ', current chroma_db/'}\n")
+    print(f"  {'size':>5} {'overlap':>7} {'chunks':>6} {'k':>3} {'hit@k':>6} {'recall@k':>8} "
+          f"{'MRR':>6}   {'embed p50/p95 ms':>16}   {'search p50/p95 ms':>17}")
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench_retrieval_") if sweep else None
+    try:
+        for size, overlap in configs:
+            if sweep:
+                path = os.path.join(workdir, f"index_{size}_{overlap}")
+                chunks = build_index(path, size, overlap)
+                retriever = open_index(engine, embeddings, path)
+            else:
+                retriever = engine.hybrid_retriever
+                chunks = len(engine.vector_store.get(include=[])["ids"])
+            for k in args.k:
+                summary, rows = evaluate(retriever, embeddings, cases, k)
+                print(f"  {size:>5} {overlap:>7} {chunks:>6} {k:>3} {summary['hit_at_k']:>6.1%} "
+                      f"{summary['recall_at_k']:>8.1%} {summary['mrr']:>6.3f}   "
+                      f"{summary['embed_ms_p50']:>7.1f} /{summary['embed_ms_p95']:>7.1f}   "
+                      f"{summary['search_ms_p50']:>8.1f} /{summary['search_ms_p95']:>7.1f}")
+                if args.verbose:
+                    for row in rows:
+                        if row["recall"] < 1:
+                            print(f"        miss: {row['question'][:50]!r} -> {row['retrieved']}")
+                results.append({"chunk_size": size, "chunk_overlap": overlap, "chunks": chunks,
+                                **summary, "questions": rows})
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n  Results saved to: {args.output}")
+    print(f"{'=' * 78}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Slang Expander Micro-Benchmark
+==============================
+Checks that the single-pass compiled expander in rag_engine produces the same
+output as the original one-regex-per-entry loop, then times both.
+
+Usage:
+    python benchmarks/bench_slang.py
+    python benchmarks/bench_slang.py --iterations 5000
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_engine import SLANG_MAP, _expand_slang  # noqa: E402
+
+# ── Sample questions (taken from test_system.py + typical student phrasing) ──
+QUESTIONS = [
+    "What are the bus routes available at KR Mangalam University?",
+    "Tell me about placements at KRMU. What is the highest package?",
+    "What is the fee structure for BTech CSE?",
+    "bhai placement kaisa hai krmu mein?",
+    "yo whats the fee structure",
+    "hostel ki fees kitni hai?",
+    "ngl the hostel is kinda mid, wanna know abt other options",
+    "pls tell me abt scholarships asap, idk how to apply",
+    "kab hai exam? btw wat is the attendance rule",
+    "u r gr8, thx 4 the info abt the sem fees",
+    "kya scholarship milega agar cgpa 9 hai?",
+    "hod se kaise milna hai, dept kahan hai",
+    "lmk the bus timings 2moro morning plz",
+    "is there any kt exam for backlog subjects?",
+    "What is the anti-ragging policy at KRMU?",
+    "TBH the canteen food is fire, bussin fr",
+    "Hostel AC room ka paisa kitna hai yaar",
+    "",
+]
+
+# Phrases the old loop could never match, because an earlier single-word entry
+# ("cap", "theek", "fr", "vibe", "tea", ...) always rewrote them first. The new
+# expander lets these multi-word phrases win, so they are checked separately.
+PHRASES = {
+    "no cap this is true": "seriously this is true",
+    "theek hai, thanks": "it is fine, thanks",
+    "fees fr fr": "fees for real for real",
+}
+
+
+def legacy_expand_slang(text):
+    """The original implementation: one re.sub per SLANG_MAP entry."""
+    result = text
+    for pattern, replacement in SLANG_MAP.items():
+        result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
+    return result
+
+
+def check_equivalence():
+    mismatches = []
+    for question in QUESTIONS:
+        for variant in (question, question.upper(), question.lower()):
+            expected = legacy_expand_slang(variant)
+            actual = _expand_slang(variant)
+            if expected != actual:
+                mismatches.append((variant, expected, actual))
+    for phrase, expected in PHRASES.items():
+        actual = _expand_slang(phrase)
+        if expected != actual:
+            mismatches.append((phrase, expected, actual))
+    return mismatches
+
+
+def time_fn(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for question in QUESTIONS:
+            fn(question)
+    return (time.perf_counter() - start) / (iterations * len(QUESTIONS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'=' * 50}")
+    print(f"  Slang Expander Benchmark ({len(SLANG_MAP)} entries)")
+    print(f"{'=' * 50}")
+
+    mismatches = check_equivalence()
+    if mismatches:
+        for text, expected, actual in mismatches:
+            print(f"  [-] {text!r}\n      expected: {expected!r}\n      actual:   {actual!r}")
+        print(f"\n  {len(mismatches)} mismatch(es) — not benchmarking.")
+        sys.exit(1)
+    print(f"  [+] Output matches legacy loop on {len(QUESTIONS) * 3} inputs, "
+          f"{len(PHRASES)} multi-word phrases resolved")
+
+    legacy = time_fn(legacy_expand_slang, args.iterations)
+    compiled = time_fn(_expand_slang, args.iterations)
+    print(f"  [*] legacy loop:   {legacy * 1e6:8.1f} us/query")
+    print(f"  [*] single pass:   {compiled * 1e6:8.1f} us/query")
+    print(f"  [*] speed-up:      {legacy / compiled:8.1f}x")
+    print(f"{'=' * 50}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Cold vs Warm Time-to-First-Token Benchmark
+==========================================
+Measures how long Ollama takes to produce the first answer token for real
+RAG prompts:
+
+  cold  — the model was just unloaded (first question after startup/idle)
+  warm  — after RAGEngine.warm_up(): weights resident, static prompt prefix cached
+
+Ollama's prompt_eval_count is shown next to each timing — it drops on warm
+requests because the RAG_SYSTEM_PROMPT prefix is served from its cache.
+
+Usage:
+    ollama serve
+    python benchmarks/bench_ttft.py
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag_engine  # noqa: E402
+from rag_engine import (  # noqa: E402
+    LLM_MODEL, LLM_OPTIONS, OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_TIMEOUT,
+    RAGEngine, _expand_slang,
+)
+
+QUESTIONS = [
+    "What is the fee structure for BTech CSE?",
+    "What are the hostel facilities at KRMU?",
+    "Tell me about placements at KRMU. What is the highest package?",
+    "What are the bus routes available at KR Mangalam University?",
+    "How can I apply for scholarships at KR Mangalam University?",
+]
+NUM_PREDICT = 16  # only the first tokens matter here
+
+
+def build_prompt(engine, question):
+    cleaned = _expand_slang(question)
+    embedding = engine.retrieval_cache.embed_query(cleaned)
+    docs, _ = engine.hybrid_retriever.search(cleaned, embedding)
+    prompt, _, _ = engine._build_prompt(cleaned, "", docs)
+    return prompt
+
+
+def unload_model():
+    """Ask Ollama to drop the model from memory (keep_alive=0, empty prompt)."""
+    requests.post(f"{OLLAMA_BASE_URL}/api/generate",
+                  json={"model": LLM_MODEL, "keep_alive": 0}, timeout=60)
+    time.sleep(1)
+
+
+def time_to_first_token(prompt):
+    """Return (seconds to first token, prompt_eval_count) for one streamed generation."""
+    payload = {
+        "model": LLM_MODEL,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {**LLM_OPTIONS, "num_predict": NUM_PREDICT},
+    }
+    start = time.perf_counter()
+    first = None
+    with requests.post(f"{OLLAMA_BASE_URL}/api/generate", json=payload,
+                       stream=True, timeout=OLLAMA_TIMEOUT) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if first is None and data.get("response"):
+                first = time.perf_counter() - start
+            if data.get("done"):
+                return first, data.get("prompt_eval_count")
+    return first, None
+
+
+def main():
+    print(f"{'=' * 60}")
+    print("  Cold vs Warm TTFT Benchmark")
+    print(f"{'=' * 60}")
+    rag_engine.WARMUP_ON_START = False  # this script decides when to warm up
+    engine = RAGEngine()
+    if not engine.status["ready"]:
+        print(f"  [-] Engine not ready: {engine.status}")
+        sys.exit(1)
+    prompts = [build_prompt(engine, q) for q in QUESTIONS]
+
+    unload_model()
+    cold, cold_evals = time_to_first_token(prompts[0])
+    print(f"\n  cold TTFT     : {cold:7.2f}s   (prompt_eval_count={cold_evals})")
+
+    unload_model()
+    warmup = engine.warm_up()
+    print(f"  warm-up       : {warmup:7.2f}s   (at startup, off the request path)")
+
+    warm = []
+    for prompt in prompts:
+        seconds, evals = time_to_first_token(prompt)
+        warm.append(seconds)
+        print(f"  warm TTFT     : {seconds:7.2f}s   (prompt_eval_count={evals})")
+
+    median = statistics.median(warm)
+    print(f"\n  cold {cold:.2f}s -> warm median {median:.2f}s "
+          f"({cold / median:.1f}x faster first token)")
+    print(f"{'=' * 60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Vector Backend Benchmark
+========================
+Compares RAGEngine's two dense-retrieval backends on the current index:
+Chroma (HNSW over chroma.sqlite3) and the NumPy store (exact brute force
+over a memory-mapped matrix). The chunks and embeddings are exported from
+chroma_db/ into a temporary directory first, so both search the same data
+and chroma_db/ is not touched.
+
+For each k it reports:
+
+  latency      single-query p50/p95 (ms), documents included
+  threads      queries/s with --threads concurrent callers (the NumPy store
+               batches queries that arrive together into one product)
+  batch        ms per query when all questions are searched in one call
+  recall@k     share of the exact top-k that Chroma's approximate search finds
+  hit@k        share of questions with an expected source file in the top k
+
+Usage:
+    python benchmarks/bench_vectors.py
+    python benchmarks/bench_vectors.py --k 4,20 --repeat 50 --threads 8
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag_engine  # noqa: E402
+from rag_engine import _expand_slang  # noqa: E402
+from vector_index import NumpyVectorStore, save_vectors  # noqa: E402
+
+DEFAULT_CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_set.json")
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def single_query_ms(store, vectors, k, repeat):
+    times = []
+    for _ in range(repeat):
+        for vector in vectors:
+            start = time.perf_counter()
+            store.similarity_search_by_vector(vector, k=k)
+            times.append((time.perf_counter() - start) * 1000)
+    return percentile(times, 50), percentile(times, 95)
+
+
+def threaded_qps(store, vectors, k, repeat, threads):
+    work = [v for _ in range(repeat) for v in vectors]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda v: store.similarity_search_by_vector(v, k=k), work))
+        return len(work) / (time.perf_counter() - start)
+
+
+def batch_ms(store, vectors, k, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        store.search_batch(vectors, k)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(vectors))
+
+
+def top_ids(store, vectors, k):
+    return [[doc.id for doc in store.similarity_search_by_vector(v, k=k)] for v in vectors]
+
+
+def hit_rate(rankings, cases, sources):
+    hits = sum(any(sources[i] in set(case["expected_sources"]) for i in ids)
+               for ids, case in zip(rankings, cases))
+    return hits / len(cases)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cases", default=DEFAULT_CASES, help="labeled question set (JSON)")
+    parser.add_argument("--k", type=int_list, default=[rag_engine.RETRIEVAL_K, rag_engine.RETRIEVAL_FETCH_K],
+                        help="e.g. 4,20")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the questions per timing")
+    parser.add_argument("--threads", type=int, default=rag_engine.RETRIEVAL_WORKERS,
+                        help="concurrent callers for the throughput test")
+    parser.add_argument("--output", help="also save the results as JSON")
+    args = parser.parse_args()
+
+    with open(args.cases) as f:
+        cases = json.load(f)
+
+    print(f"{'=' * 78}")
+    print("  Vector Backend Benchmark")
+    print(f"{'=' * 78}")
+    from langchain_chroma import Chroma
+    from langchain_huggingface import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(model_name=rag_engine.EMBEDDING_MODEL)
+    chroma = Chroma(persist_directory=rag_engine.CHROMA_PATH, embedding_function=embeddings)
+    data = chroma.get(include=["embeddings", "documents", "metadatas"])
+    if not data["ids"]:
+        print("  [-] Vector store is empty — run 'python ingest.py' first.")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="bench_vectors_")
+    try:
+        size = save_vectors(workdir, [(data["ids"], data["embeddings"], data["documents"], data["metadatas"])],
+                            len(data["ids"]))
+        start = time.perf_counter()
+        numpy_store = NumpyVectorStore(workdir, embeddings)
+        load_ms = (time.perf_counter() - start) * 1000
+        sources = {i: (m or {}).get("source", "Unknown") for i, m in zip(data["ids"], data["metadatas"])}
+        vectors = [embeddings.embed_query(_expand_slang(case["question"])) for case in cases]
+        print(f"  {len(data['ids'])} chunks ({size // 1024} KB float32), {len(cases)} questions, "
+              f"NumPy store loaded in {load_ms:.1f} ms\n")
+        print(f"  {'backend':<7} {'k':>3}   {'p50/p95 ms':>13}   {f'{args.threads} threads':>11}   "
+              f"{'batch ms/q':>10}   {'recall@k':>8}   {'hit@k':>6}")
+
+        results = []
+        for k in args.k:
+            exact = top_ids(numpy_store, vectors, k)
+            for name, store in (("chroma", chroma), ("numpy", numpy_store)):
+                store.similarity_search_by_vector(vectors[0], k=k)  # warm caches / pages
+                p50, p95 = single_query_ms(store, vectors, k, args.repeat)
+                qps = threaded_qps(store, vectors, k, args.repeat, args.threads)
+                batch = batch_ms(store, vectors, k, args.repeat) if name == "numpy" else None
+                ranked = exact if name == "numpy" else top_ids(store, vectors, k)
+                recall = sum(len(set(r) & set(e)) / len(e) for r, e in zip(ranked, exact)) / len(exact)
+                hits = hit_rate(ranked, cases, sources)
+                print(f"  {name:<7} {k:>3}   {p50:>6.2f} /{p95:>5.2f}   {qps:>7.0f} q/s   "
+                      f"{f'{batch:.3f}' if batch is not None else '—':>10}   {recall:>8.1%}   {hits:>6.1%}")
+                results.append({"backend": name, "k": k, "p50_ms": round(p50, 3), "p95_ms": round(p95, 3),
+                                "threaded_qps": round(qps, 1), "threads": args.threads,
+                                "batch_ms_per_query": round(batch, 4) if batch is not None else None,
+                                "recall_at_k": round(recall, 4), "hit_at_k": round(hits, 4)})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"chunks": len(data["ids"]), "results": results}, f, indent=2)
+        print(f"\n  Results saved to: {args.output}")
+    print(f"{'=' * 78}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Multi-Worker Scaling Benchmark
+==============================
+Starts serve.py with 1..N worker processes against a stubbed LLM
+(fake_ollama.py answering in milliseconds, so the work measured is the API,
+query embedding and retrieval) and reports, per worker count:
+
+  req/s     /chat throughput under a closed loop of --concurrency clients
+  latency   p50/p95 per request
+  memory    per-worker USS (private pages) and PSS (shared pages split
+            between the processes using them), and the PSS of the whole
+            server — what it really costs in RAM
+
+Every question is made unique and the answer/retrieval caches are off, so
+each request embeds its question. Run it with --no-preload as well to see
+what the copy-on-write sharing saves: without it every worker loads its
+own model. Memory figures come from /proc (Linux only).
+
+--stub-embeddings swaps the embedding model for a word-hashing stub that
+spins the CPU for STUB_EMBED_SECONDS per query — for machines that can't
+download the model. Its figures leave out the model weights.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1,2,4
+    python benchmarks/bench_workers.py --workers 1,2,4 --no-preload
+    python benchmarks/bench_workers.py --workers 1,2 --stub-embeddings --vector-backend numpy
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_load import closed_loop, free_port, git_commit, send_chat, summarize  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+
+READY_TIMEOUT = 300  # seconds for every worker to report ready
+STUB_EMBED_SECONDS = 0.01  # CPU per stub query embedding, about MiniLM's on a short question
+STUB_DIMENSIONS = 384      # all-MiniLM-L6-v2's, so the stub can search an existing index
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+# ── Server under test ──────────────────────────────────────────
+class StubEmbeddings:
+    """Stands in for HuggingFaceEmbeddings: hashed bag of words, unit length."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def embed_query(self, text):
+        end = time.perf_counter() + STUB_EMBED_SECONDS
+        while time.perf_counter() < end:
+            pass
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    @staticmethod
+    def _vector(text):
+        vector = [0.0] * STUB_DIMENSIONS
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % STUB_DIMENSIONS] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+
+def serve(args):
+    """--serve: run serve.py in this process with the caches off, against fake Ollama."""
+    if args.stub_embeddings:
+        import langchain_huggingface  # light — torch loads only with a real model
+        langchain_huggingface.HuggingFaceEmbeddings = StubEmbeddings
+    import rag_engine
+    if args.vector_backend:
+        rag_engine.VECTOR_BACKEND = args.vector_backend
+    rag_engine.OLLAMA_BASE_URL = args.ollama_url
+    rag_engine.WARMUP_ON_START = False
+    rag_engine.RESPONSE_CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_workers_"),
+                                                  "response_cache.sqlite3")
+    rag_engine.RESPONSE_CACHE_MAX_BYTES = 0
+    rag_engine.SEMANTIC_CACHE_SIZE = 0
+    rag_engine.RETRIEVAL_CACHE_SIZE = 0
+    rag_engine.LLM_QUEUE_SIZE = 1024  # measure throughput, not the 429 policy
+
+    import serve as server
+    argv = ["--workers", str(args.workers[0]), "--bind", f"127.0.0.1:{args.port}"]
+    if args.no_preload:
+        argv.append("--no-preload")
+    server.main(argv)
+
+
+def start_server(workers, port, ollama_url, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--workers", str(workers),
+           "--port", str(port), "--ollama-url", ollama_url]
+    if args.no_preload:
+        cmd.append("--no-preload")
+    if args.stub_embeddings:
+        cmd.append("--stub-embeddings")
+    if args.vector_backend:
+        cmd += ["--vector-backend", args.vector_backend]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+
+
+def wait_all_ready(url, workers):
+    """Wait until fresh connections — spread over the workers by the kernel —
+    keep reporting ready."""
+    streak, needed = 0, 4 * workers
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            ready = httpx.get(f"{url}/health", timeout=5).json().get("ready")
+        except (httpx.HTTPError, ValueError):
+            ready = False
+        streak = streak + 1 if ready else 0
+        if streak >= needed:
+            return True
+        time.sleep(0.05 if ready else 0.5)
+    return False
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ── Memory ─────────────────────────────────────────────────────
+def worker_pids(parent):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # pid (comm) state ppid ... — comm may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            pids.append(int(entry))
+    return pids
+
+
+def memory_mb(pid):
+    """RSS, PSS and USS (private clean + dirty) of a process in MB."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        "rss": round(fields.get("Rss", 0) / 1024, 1),
+        "pss": round(fields.get("Pss", 0) / 1024, 1),
+        "uss": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def server_memory(proc):
+    master = memory_mb(proc.pid)
+    workers = [m for m in map(memory_mb, worker_pids(proc.pid)) if m]
+    if master is None or not workers:
+        return None
+
+    def mean(key):
+        return round(sum(m[key] for m in workers) / len(workers), 1)
+
+    return {
+        "worker_rss_mb": mean("rss"),
+        "worker_pss_mb": mean("pss"),
+        "worker_uss_mb": mean("uss"),
+        "master_pss_mb": master["pss"],
+        "total_pss_mb": round(master["pss"] + sum(m["pss"] for m in workers), 1),
+    }
+
+
+# ── Main ───────────────────────────────────────────────────────
+async def measure(url, args):
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        await closed_loop(send_chat, client, args.warmup, args.concurrency, unique=True)
+        start = time.perf_counter()
+        samples = await closed_loop(send_chat, client, args.requests, args.concurrency, unique=True)
+        return summarize(samples, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--workers", type=int_list, default=[1, 2, 4], help="worker counts, e.g. 1,2,4")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed-loop clients")
+    parser.add_argument("--warmup", type=int, default=32, help="unmeasured requests per worker count")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout (s)")
+    parser.add_argument("--no-preload", action="store_true", help="each worker loads its own models")
+    parser.add_argument("--stub-embeddings", action="store_true",
+                        help="hashing stub instead of the embedding model (no download)")
+    parser.add_argument("--vector-backend", choices=["chroma", "numpy"],
+                        help="override rag_engine.VECTOR_BACKEND")
+    parser.add_argument("--output", help="also save the results as JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ollama-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    print(f"{'=' * 78}")
+    print("  Multi-Worker Scaling Benchmark")
+    print(f"{'=' * 78}")
+    fake = FakeOllama(port=0, prefill=0.0, tps=5000, tokens=20, parallel=256).start()
+    print(f"  Stub LLM on {fake.url}; {args.requests} unique /chat requests, "
+          f"concurrency {args.concurrency}, {os.cpu_count()} CPUs, "
+          f"{'no preload' if args.no_preload else 'preloaded + fork'}"
+          f"{', stub embeddings' if args.stub_embeddings else ''}"
+          f"{f', {args.vector_backend} backend' if args.vector_backend else ''}\n")
+    print(f"  {'workers':>7} {'req/s':>8} {'speedup':>7} {'p50 s':>7} {'p95 s':>7}   "
+          f"{'worker USS':>10} {'worker PSS':>10} {'total PSS':>10}")
+
+    results, base = [], None
+    for workers in args.workers:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        proc = start_server(workers, port, fake.url, args)
+        try:
+            if not wait_all_ready(url, workers):
+                print(f"  [-] {workers} worker(s) not ready after {READY_TIMEOUT}s — skipped")
+                continue
+            metrics = asyncio.run(measure(url, args))
+            memory = server_memory(proc)
+        finally:
+            stop_server(proc)
+
+        rps = metrics["throughput_rps"]
+        base = base or rps
+        latency = metrics["latency_s"]
+        mem = memory or {}
+        print(f"  {workers:>7} {rps:>8.1f} {rps / base if base else 0:>6.2f}x "
+              f"{latency['p50'] or 0:>7.3f} {latency['p95'] or 0:>7.3f}   "
+              f"{mem.get('worker_uss_mb', 0):>7.0f} MB {mem.get('worker_pss_mb', 0):>7.0f} MB "
+              f"{mem.get('total_pss_mb', 0):>7.0f} MB")
+        if metrics["errors"]:
+            print(f"          errors: {metrics['errors']}")
+        results.append({"workers": workers, "preload": not args.no_preload,
+                        "stub_embeddings": args.stub_embeddings, "vector_backend": args.vector_backend,
+                        **metrics, "memory": memory})
+    fake.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "cpus": os.cpu_count(), "results": results}, f, indent=2)
+        print(f"\n  Results saved to: {args.output}")
+    print(f"{'=' * 78}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Fake Ollama Server
+==================
+A stand-in for Ollama for load tests, so the API can be benchmarked without
+a model — in CI or on a laptop. It answers /api/tags and /api/version, and
+streams /api/generate like Ollama does (NDJSON lines, eval counters on the
+final line). Latency is simulated: each generation waits for one of
+`--parallel` slots (Ollama on CPU runs one at a time), sleeps `--prefill`
+seconds for prompt evaluation, then emits tokens at `--tps` tokens/second.
+
+Used by bench_load.py --local; it can also be run on its own and pointed
+at by setting rag_engine.OLLAMA_BASE_URL.
+
+Usage:
+    python benchmarks/fake_ollama.py --port 11435 --prefill 0.5 --tps 20
+"""
+
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "KR Mangalam University offers hostel accommodation, a placement cell, "
+    "scholarships and bus routes across Delhi NCR. Please check the official "
+    "website or contact the admissions office for the latest details."
+)
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Threaded HTTP server speaking enough of the Ollama API for the RAG engine."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=11435, model="qwen2.5:3b",
+                 prefill=0.5, tps=20.0, tokens=60, parallel=1):
+        super().__init__((host, port), _Handler)
+        self.model = model
+        self.prefill = prefill    # seconds of simulated prompt evaluation
+        self.tps = tps            # generated tokens per second
+        self.tokens = tokens      # answer length, capped by options.num_predict
+        self.slots = threading.Semaphore(parallel)
+        self.words = ANSWER.split()
+        self.generations = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve on a background thread; returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive + chunked streaming, like Ollama
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            model = self.server.model
+            self._send_json({"models": [{
+                "name": model, "model": model, "size": 1_900_000_000,
+                "details": {"family": "fake", "parameter_size": "3B",
+                            "quantization_level": "Q4_K_M"},
+            }]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, status=404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = body.get("prompt", "")
+        if not prompt:
+            # Load/unload request (e.g. keep_alive=0) — nothing to generate
+            self._send_json(self._line("", done=True))
+            return
+
+        server = self.server
+        limit = (body.get("options") or {}).get("num_predict") or server.tokens
+        count = max(1, min(server.tokens, limit if limit > 0 else server.tokens))
+        stream = body.get("stream", True)
+
+        start = time.perf_counter()
+        with server.slots:
+            server.generations += 1
+            time.sleep(server.prefill)
+            prefilled = time.perf_counter()
+            if stream:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+            pieces = []
+            try:
+                for i in range(count):
+                    time.sleep(1 / server.tps)
+                    piece = server.words[i % len(server.words)] + ("" if i == count - 1 else " ")
+                    pieces.append(piece)
+                    if stream:
+                        self._write_chunk(self._line(piece))
+            except (BrokenPipeError, ConnectionResetError):
+                return  # client went away — free the slot
+            done = time.perf_counter()
+
+        final = self._line("" if stream else "".join(pieces), done=True)
+        final.update({
+            "done_reason": "length" if count == limit else "stop",
+            "total_duration": int((done - start) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "prompt_eval_duration": int((prefilled - start) * 1e9),
+            "eval_count": count,
+            "eval_duration": int((done - prefilled) * 1e9),
+        })
+        try:
+            if stream:
+                self._write_chunk(final)
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                self._send_json(final)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _line(self, text, done=False):
+        return {
+            "model": self.server.model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": done,
+        }
+
+    def _write_chunk(self, obj):
+        data = (json.dumps(obj) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, obj, status=200):
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", default="qwen2.5:3b")
+    parser.add_argument("--prefill", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tps", type=float, default=20.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per answer")
+    parser.add_argument("--parallel", type=int, default=1, help="concurrent generations")
+    args = parser.parse_args()
+
+    server = FakeOllama(args.host, args.port, args.model, args.prefill, args.tps,
+                        args.tokens, args.parallel)
+    print(f"  Fake Ollama on {server.url} — prefill {args.prefill}s, {args.tps} tok/s, "
+          f"{args.tokens} tokens, {args.parallel} parallel (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
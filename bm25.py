@@ -0,0 +1,115 @@
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter, defaultdict
+
+# Written by ingest.py into chroma_db/, next to the Chroma data
+BM25_INDEX_FILE = "bm25_index.json"
+
+# ── Tokenization ───────────────────────────────────────────────
+# Plain word tokens, plus punctuation-free forms of compounds so that
+# "B.Tech" matches "btech" and "1,50,000" matches "150000".
+_WORD = re.compile(r"[a-z0-9]+")
+_COMPOUND = re.compile(r"[a-z0-9]+(?:[.,/\-][a-z0-9]+)+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how i in is it its me my "
+    "of on or so that the their there this to was what when where which who why "
+    "will with you your".split()
+)
+
+
+def tokenize(text: str):
+    text = text.lower()
+    tokens = [t for t in _WORD.findall(text) if t not in STOPWORDS]
+    tokens.extend(re.sub(r"[.,/\-]", "", c) for c in _COMPOUND.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """Compact inverted index with precomputed BM25 term weights.
+
+    Each posting stores the final BM25 contribution of a term to a chunk, so a
+    query is a handful of dict lookups and additions — well under a
+    millisecond for a corpus of a few thousand chunks.
+    """
+
+    def __init__(self, doc_ids, postings):
+        self.doc_ids = doc_ids    # position -> chunk ID
+        self.postings = postings  # term -> ([position, ...], [weight, ...])
+
+    @classmethod
+    def build(cls, doc_ids, texts, k1: float = 1.5, b: float = 0.75):
+        return cls.build_paged(lambda: iter([(doc_ids, texts)]), k1, b)
+
+    @classmethod
+    def build_paged(cls, pages, k1: float = 1.5, b: float = 0.75):
+        """build() over a corpus read a page at a time.
+
+        `pages()` returns a fresh iterator of (doc_ids, texts) pages. It is
+        read twice — once for document lengths and frequencies, once for the
+        weights — so only the index itself grows with the corpus.
+        """
+        lengths, doc_freq = [], Counter()
+        for _, texts in pages():
+            for text in texts:
+                tf = Counter(tokenize(text))
+                lengths.append(sum(tf.values()))
+                doc_freq.update(tf.keys())
+        n = len(lengths)
+        avg_len = (sum(lengths) / n) if n else 0.0
+
+        doc_ids = []
+        postings = defaultdict(lambda: ([], []))
+        for ids, texts in pages():
+            for doc_id, text in zip(ids, texts):
+                pos = len(doc_ids)
+                if pos >= n:
+                    raise ValueError("corpus changed between the two passes")
+                doc_ids.append(doc_id)
+                norm = k1 * (1 - b + b * lengths[pos] / avg_len) if avg_len else k1
+                for term, freq in Counter(tokenize(text)).items():
+                    idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                    positions, weights = postings[term]
+                    positions.append(pos)
+                    weights.append(round(idf * freq * (k1 + 1) / (freq + norm), 4))
+        if len(doc_ids) != n:
+            raise ValueError("corpus changed between the two passes")
+        return cls(doc_ids, dict(postings))
+
+    def search(self, query: str, k: int):
+        """Return up to k (chunk ID, score) pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting:
+                for pos, weight in zip(*posting):
+                    scores[pos] += weight
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.doc_ids[pos], score) for pos, score in best]
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"doc_ids": self.doc_ids, "postings": self.postings}, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["doc_ids"], {t: tuple(p) for t, p in data["postings"].items()})
+
+
+def reciprocal_rank_fusion(rankings, weights, k: int = 60):
+    """Fuse ranked ID lists: score(d) = sum(w / (k + rank)) over the lists containing d.
+
+    Returns (ID, fused score) pairs, best first.
+    """
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
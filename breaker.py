@@ -0,0 +1,85 @@
+import time
+import threading
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open."""
+
+
+# ── Circuit breaker ────────────────────────────────────────────
+class CircuitBreaker:
+    """Fails generation fast once Ollama has timed out or refused repeatedly.
+
+    closed    — calls go through; `failure_threshold` consecutive failures open it
+    open      — calls are refused for `reset_timeout` seconds
+    half_open — one trial call goes through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.counters = {"opened": 0, "rejected": 0}
+        self.last_error = None
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self, claim: bool = True) -> bool:
+        """True if a call may go to the LLM now (claims the trial when half-open,
+        unless claim=False — a look ahead for a call that isn't made yet)."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = claim
+                return True
+            self.counters["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self, error: BaseException = None):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if error is not None:
+                self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """End a call that neither succeeded nor failed (e.g. the client left)."""
+        with self._lock:
+            self._trial_running = False
+
+    def trip(self, reason: str):
+        """Open the breaker now — e.g. the health monitor saw Ollama go away."""
+        with self._lock:
+            self.last_error = reason
+            if self.state != "open":
+                self._open()
+            else:
+                self._opened_at = time.monotonic()  # still down — keep it open
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                **self.counters,
+                "last_error": self.last_error,
+            }
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self.counters["opened"] += 1
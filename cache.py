@@ -0,0 +1,374 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.documents import Document
+
+# ── Index version stamp ────────────────────────────────────────
+# ingest.py writes a fresh stamp into chroma_db/ after every build, so any
+# cache filled against an older index can tell its entries are stale.
+INDEX_VERSION_FILE = "index_version"
+
+
+def read_index_version(chroma_path: str) -> str:
+    """Return the current index version stamp ("" if there is no index)."""
+    try:
+        with open(os.path.join(chroma_path, INDEX_VERSION_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    # Index built before stamps existed — fall back to the SQLite file's mtime
+    try:
+        return f"mtime:{os.stat(os.path.join(chroma_path, 'chroma.sqlite3')).st_mtime_ns}"
+    except OSError:
+        return ""
+
+
+def bump_index_version(chroma_path: str) -> str:
+    """Write a new version stamp after (re)building the index."""
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(chroma_path, exist_ok=True)
+    tmp_path = os.path.join(chroma_path, INDEX_VERSION_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(chroma_path, INDEX_VERSION_FILE))
+    return version
+
+
+# ── Semantic answer cache ──────────────────────────────────────
+class SemanticCache:
+    """Answer cache keyed by query-embedding similarity.
+
+    A lookup returns the stored answer of the most similar recently answered
+    question when its cosine similarity is at least `threshold`. Entries expire
+    after `ttl` seconds, the least recently used entry is evicted once
+    `max_entries` is reached, and everything is dropped when the index version
+    changes.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, threshold: float = 0.92):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (unit vector, answer, source_docs, expires_at)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding, version: str):
+        """Return (answer, source_docs) for a similar question, or None."""
+        query = _unit(embedding)
+        with self._lock:
+            self._check_version(version)
+            now = time.monotonic()
+            best_key, best_score = None, self.threshold
+            for key, (vector, _, _, expires_at) in list(self._entries.items()):
+                if expires_at <= now:
+                    del self._entries[key]
+                    continue
+                score = float(np.dot(vector, query))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            _, answer, source_docs, _ = self._entries[best_key]
+            return answer, source_docs
+
+    def store(self, embedding, answer: str, source_docs, version: str):
+        with self._lock:
+            self._check_version(version)
+            self._entries[uuid.uuid4().hex] = (
+                _unit(embedding), answer, list(source_docs), time.monotonic() + self.ttl,
+            )
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# ── Exact-match response cache (shared on disk) ────────────────
+class ResponseCache:
+    """Deterministic answer cache stored in a local SQLite file.
+
+    Keys combine the normalized question, a digest of the chat history that
+    went into the prompt and the index version stamp, so a rebuilt index never
+    serves stale answers. Every process that opens the same file (uvicorn
+    workers, the Streamlit app) shares entries and hit/miss counters, and the
+    cache survives restarts. Least recently used entries are evicted once the
+    stored answers exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._version = None
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, version TEXT, answer TEXT,"
+                    " sources TEXT, size INTEGER, last_access REAL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)"
+                )
+        except sqlite3.Error as e:
+            print(f"[Cache] Response cache disabled: {e}")
+            self.path = None
+
+    @staticmethod
+    def make_key(question: str, chat_history: str, version: str) -> str:
+        """Hash the normalized question, history digest and index version."""
+        normalized = " ".join(re.findall(r"\w+", question.lower()))
+        history_digest = hashlib.sha256(chat_history.encode()).hexdigest()
+        return hashlib.sha256(f"{version}\0{history_digest}\0{normalized}".encode()).hexdigest()
+
+    def get(self, key: str):
+        """Return (answer, source_docs) or None."""
+        if not self.path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT answer, sources FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+                    )
+                self._bump(conn, "hits" if row else "misses")
+        except sqlite3.Error as e:
+            print(f"[Cache] Lookup failed: {e}")
+            return None
+        if not row:
+            return None
+        answer, sources = row
+        return answer, [
+            Document(page_content=d["page_content"], metadata=d["metadata"], id=d.get("id"))
+            for d in json.loads(sources)
+        ]
+
+    def put(self, key: str, answer: str, source_docs, version: str):
+        if not self.path:
+            return
+        sources = json.dumps([
+            {"page_content": d.page_content, "metadata": d.metadata, "id": getattr(d, "id", None)}
+            for d in source_docs
+        ])
+        size = len(answer.encode()) + len(sources.encode())
+        try:
+            with self._connect() as conn:
+                # Answers from an older index can never be hit again — drop them
+                if version != self._version:
+                    conn.execute("DELETE FROM responses WHERE version != ?", (version,))
+                    self._version = version
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, version, answer, sources, size, time.time()),
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"[Cache] Store failed: {e}")
+
+    @property
+    def stats(self):
+        if not self.path:
+            return {"enabled": False}
+        try:
+            conn = self._connect()
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error as e:
+            return {"enabled": True, "error": str(e)}
+        return {
+            "enabled": True,
+            "entries": entries,
+            "bytes": size,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+        }
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _bump(conn, name):
+        conn.execute(
+            "INSERT INTO stats VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+
+# ── Query-embedding / retrieval-result cache ───────────────────
+class RetrievalCache:
+    """In-process cache between RAGEngine and the Chroma vector store.
+
+    Remembers question -> embedding and embedding -> top-k document IDs, and
+    keeps the retrieved documents by ID so a repeated question skips both the
+    embedding model and the Chroma/SQLite round-trip. Both maps are LRU-bounded
+    and cleared whenever the index version changes; `reopen(version)` is then
+    called and may return a fresh vector store to search from then on.
+    """
+
+    def __init__(self, vector_store, embeddings, k: int, chroma_path: str,
+                 max_entries: int = 1024, reopen=None):
+        self.vector_store = vector_store
+        self.reopen = reopen
+        self.embeddings = embeddings
+        self.k = k
+        self.chroma_path = chroma_path
+        self.max_entries = max_entries
+        self.counters = {"embed_hits": 0, "embed_misses": 0, "search_hits": 0, "search_misses": 0}
+        self._embeddings = OrderedDict()  # normalized question -> embedding
+        self._results = OrderedDict()     # embedding digest -> [doc id, ...]
+        self._docs = {}                   # doc id -> Document
+        self._vectors = {}                # doc id -> stored chunk embedding
+        self._version = None
+        self._lock = threading.Lock()
+
+    def embed_query(self, text: str):
+        key = " ".join(text.split())
+        with self._lock:
+            self._check_version()
+            embedding = self._embeddings.get(key)
+            if embedding is not None:
+                self._embeddings.move_to_end(key)
+                self.counters["embed_hits"] += 1
+                return embedding
+            self.counters["embed_misses"] += 1
+        embedding = self.embeddings.embed_query(text)
+        with self._lock:
+            _put_lru(self._embeddings, key, embedding, self.max_entries)
+        return embedding
+
+    def search(self, embedding):
+        """Return the top-k documents for an embedding."""
+        key = hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+        with self._lock:
+            self._check_version()
+            ids = self._results.get(key)
+            if ids is not None and all(i in self._docs for i in ids):
+                self._results.move_to_end(key)
+                self.counters["search_hits"] += 1
+                return [self._docs[i] for i in ids]
+            self.counters["search_misses"] += 1
+        docs = self.vector_store.similarity_search_by_vector(embedding, k=self.k)
+        with self._lock:
+            # Documents without an ID can't be re-served from the cache
+            if all(d.id for d in docs):
+                for doc in docs:
+                    self._docs[doc.id] = doc
+                _put_lru(self._results, key, [d.id for d in docs], self.max_entries)
+        return docs
+
+    def get_documents(self, ids):
+        """Return documents by ID, fetching any that aren't cached yet."""
+        with self._lock:
+            self._check_version()
+            missing = [i for i in ids if i not in self._docs]
+        if missing:
+            fetched = self.vector_store.get_by_ids(missing)
+            with self._lock:
+                for doc in fetched:
+                    self._docs[doc.id] = doc
+        return [self._docs[i] for i in ids if i in self._docs]
+
+    def get_embeddings(self, ids):
+        """Return the chunk embeddings Chroma already stores, as a (len(ids), dim) array."""
+        with self._lock:
+            self._check_version()
+            missing = [i for i in ids if i not in self._vectors]
+        if missing:
+            stored = self.vector_store.get(ids=missing, include=["embeddings"])
+            with self._lock:
+                for doc_id, vector in zip(stored["ids"], stored["embeddings"]):
+                    self._vectors[doc_id] = np.asarray(vector, dtype=np.float32)
+        return np.stack([self._vectors[i] for i in ids])
+
+    def invoke(self, text: str):
+        return self.search(self.embed_query(text))
+
+    @property
+    def stats(self):
+        c = self.counters
+        return {
+            **c,
+            "embed_hit_rate": _rate(c["embed_hits"], c["embed_misses"]),
+            "search_hit_rate": _rate(c["search_hits"], c["search_misses"]),
+        }
+
+    def _check_version(self):
+        version = read_index_version(self.chroma_path)
+        if version != self._version:
+            if self._version is not None and self.reopen is not None:
+                self.vector_store = self.reopen(version) or self.vector_store
+            self._embeddings.clear()
+            self._results.clear()
+            self._docs.clear()
+            self._vectors.clear()
+            self._version = version
+
+
+def _put_lru(entries, key, value, max_entries):
+    entries[key] = value
+    entries.move_to_end(key)
+    while len(entries) > max_entries:
+        entries.popitem(last=False)
+
+
+def _rate(hits, misses):
+    total = hits + misses
+    return round(hits / total, 3) if total else 0.0
@@ -0,0 +1,100 @@
+import re
+import math
+from functools import lru_cache
+
+from langchain_core.documents import Document
+
+# ── Token counting ─────────────────────────────────────────────
+# The LLM's own tokenizer is used when it is available locally; otherwise a
+# character-based estimate stands in. Chunks repeat across requests, so
+# counts are memoized.
+LLM_TOKENIZER = "Qwen/Qwen2.5-3B-Instruct"
+CHARS_PER_TOKEN = 3.5  # conservative average for English text on Qwen2.5
+
+_SENTENCE_END = re.compile(r"(?<=[.!?:])\s+|\n+")
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(LLM_TOKENIZER)
+            print(f"[Packer] Counting tokens with {LLM_TOKENIZER}")
+        except Exception:
+            print(f"[Packer] {LLM_TOKENIZER} tokenizer not cached — estimating "
+                  f"{CHARS_PER_TOKEN} chars/token")
+    return _tokenizer
+
+
+def _count(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+count_tokens = lru_cache(maxsize=4096)(_count)
+
+
+# ── Packing ────────────────────────────────────────────────────
+def format_history(messages, budget: int, max_chars: int = 200) -> str:
+    """Render chat history newest-first until `budget` tokens are used.
+
+    Each message is truncated to `max_chars`; older messages that don't fit
+    are dropped.
+    """
+    lines = []
+    used = count_tokens("Recent conversation:\n\n")
+    for msg in reversed(messages):
+        role = "Student" if msg["role"] == "user" else "Assistant"
+        line = f"{role}: {msg['content'][:max_chars]}\n"
+        cost = count_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return "Recent conversation:\n" + "".join(reversed(lines)) + "\n"
+
+
+def pack_context(docs, budget: int, min_tokens: int = 48):
+    """Fill `budget` tokens with docs in relevance order.
+
+    The last doc that doesn't fit whole is cut at a sentence boundary; the
+    rest are dropped. Returns (packed docs, context tokens used).
+    """
+    packed, used = [], 0
+    for doc in docs:
+        separator = count_tokens("\n\n") if packed else 0
+        remaining = budget - used - separator
+        cost = count_tokens(doc.page_content)
+        if cost <= remaining:
+            packed.append(doc)
+            used += separator + cost
+            continue
+        if remaining >= min_tokens:
+            text = _trim_to_sentences(doc.page_content, remaining)
+            if text:
+                packed.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+                used += separator + _count(text)
+        break
+    return packed, used
+
+
+def _trim_to_sentences(text: str, budget: int) -> str:
+    """Longest prefix of whole sentences that fits in `budget` tokens."""
+    ends = [m.start() for m in _SENTENCE_END.finditer(text)]
+    lo, hi, best = 0, len(ends) - 1, ""
+    while lo <= hi:  # prefix token counts grow with the cut point
+        mid = (lo + hi) // 2
+        prefix = text[:ends[mid]].rstrip()
+        if _count(prefix) <= budget:  # one-off prefixes — keep them out of the memo
+            best, lo = prefix, mid + 1
+        else:
+            hi = mid - 1
+    return best
@@ -0,0 +1,72 @@
+import io
+import os
+import time
+import pstats
+import random
+import cProfile
+import threading
+
+
+# ── Request hooks ──────────────────────────────────────────────
+class RequestHook:
+    """Called around every RAGEngine query; attach with RAGEngine.add_hook().
+
+    on_start() runs before slang expansion, on_finish() once the answer is
+    complete (or failed) — on the thread/event loop that made the request.
+    Hooks may add JSON-serializable entries to ctx.extra; they appear in
+    the request's debug trace. A hook that raises is reported and skipped.
+    """
+
+    def on_start(self, ctx):
+        pass
+
+    def on_finish(self, ctx, error=None):
+        pass
+
+
+class CProfileHook(RequestHook):
+    """Profiles a random `sample_rate` fraction of requests with cProfile.
+
+    cProfile follows one thread: on the sync path (Streamlit, query())
+    that is the whole request; on the async API path it is the event loop,
+    i.e. generation and whatever else the loop ran meanwhile. One request is
+    profiled at a time. The top functions by cumulative time go into
+    ctx.extra["profile"]; with `output_dir`, the full stats are also dumped
+    as .prof files (open with snakeviz or `python -m pstats`).
+    """
+
+    def __init__(self, sample_rate: float = 0.01, output_dir: str = None, top: int = 15):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.top = top
+        self._busy = threading.Lock()
+        self._profiler = None
+        self._ctx = None
+
+    def on_start(self, ctx):
+        if random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active on this thread
+            self._busy.release()
+            return
+        self._profiler, self._ctx = profiler, ctx
+
+    def on_finish(self, ctx, error=None):
+        if self._ctx is not ctx:
+            return
+        profiler, self._profiler, self._ctx = self._profiler, None, None
+        try:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.top)
+            ctx.extra["profile"] = out.getvalue()
+            if self.output_dir:
+                os.makedirs(self.output_dir, exist_ok=True)
+                path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{id(ctx):x}.prof")
+                profiler.dump_stats(path)
+                ctx.extra["profile_file"] = path
+        finally:
+            self._busy.release()
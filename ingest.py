@@ -1,9 +1,22 @@
 import os
+import json
+import time
+import queue
 import shutil
+import hashlib
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import chromadb
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+
+from bm25 import BM25_INDEX_FILE, BM25Index
+from cache import bump_index_version
+from vector_index import NumpyVectorStore, save_vectors
 
 # ── Configuration ──────────────────────────────────────────────
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
@@ -12,39 +25,28 @@ EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 CHUNK_SIZE = 1500
 CHUNK_OVERLAP = 300
 
+# Per-file content hashes + chunk IDs, kept next to the Chroma data
+MANIFEST_FILE = "manifest.json"
+SUPPORTED_LOADERS = {".pdf": PyPDFLoader, ".docx": Docx2txtLoader, ".txt": TextLoader}
+INGEST_WORKERS = 1  # processes for load + chunk (1 = in-process, 0 = one per CPU)
+EMBED_BATCH_SIZE = 64  # chunks per embedding call / upsert
+QUEUE_SIZE = 4         # batches buffered between pipeline stages
+EXPORT_PAGE_SIZE = 1000  # chunks read from Chroma at a time for the BM25 / vector exports
+COLLECTION_NAME = "langchain"  # LangChain's default collection, opened by RAGEngine
 
-def load_documents(data_dir):
-    """Loads PDFs, DOCX, and TXT files from the data directory."""
-    documents = []
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-        print(f"Created '{data_dir}' directory. Please add documents there.")
-        return []
 
-    supported = {".pdf": PyPDFLoader, ".docx": Docx2txtLoader, ".txt": TextLoader}
-    for filename in sorted(os.listdir(data_dir)):
-        ext = os.path.splitext(filename)[1].lower()
-        file_path = os.path.join(data_dir, filename)
-        loader_cls = supported.get(ext)
-        if loader_cls:
-            try:
-                loader = loader_cls(file_path)
-                docs = loader.load()
-                # Tag every doc with the original filename for citations
-                for doc in docs:
-                    # Ensure metadata dict exists before assigning
-                    if not hasattr(doc, "metadata") or doc.metadata is None:
-                        doc.metadata = {"source": filename}
-                    else:
-                        doc.metadata["source"] = filename
-                documents.extend(docs)
-                print(f"  Loaded: {filename} ({len(docs)} page(s))")
-            except Exception as e:
-                print(f"  Error loading {filename}: {e}")
+def load_file(file_path, filename):
+    """Loads a single PDF, DOCX, or TXT file and tags every page with its filename."""
+    loader_cls = SUPPORTED_LOADERS[os.path.splitext(filename)[1].lower()]
+    docs = loader_cls(file_path).load()
+    # Tag every doc with the original filename for citations
+    for doc in docs:
+        # Ensure metadata dict exists before assigning
+        if not hasattr(doc, "metadata") or doc.metadata is None:
+            doc.metadata = {"source": filename}
         else:
-            print(f"  Skipping unsupported file: {filename}")
-
-    return documents
+            doc.metadata["source"] = filename
+    return docs
 
 
 def chunk_documents(documents):
@@ -59,42 +61,346 @@ def chunk_documents(documents):
     return text_splitter.split_documents(documents)
 
 
-def create_vector_store(chunks):
-    """Creates the ChromaDB vector store (wipes old DB first for a clean rebuild)."""
-    if not chunks:
-        print("No chunks to ingest.")
+def _load_and_chunk_file(task):
+    """Worker: loads and chunks one file. Errors are returned, not raised."""
+    file_path, filename = task
+    try:
+        pages = load_file(file_path, filename)
+        return filename, chunk_documents(pages), len(pages), None
+    except Exception as e:
+        return filename, [], 0, f"{type(e).__name__}: {e}"
+
+
+def load_and_chunk(data_dir, filenames, workers=INGEST_WORKERS):
+    """Yields (filename, chunks, page_count, error) per file, in the order given.
+
+    With workers > 1 each file is loaded and split in a separate process, which
+    pays off for PDFs and large handbooks on many-core machines. Results still
+    come back in input order, so chunk IDs stay deterministic. At most
+    2 x workers files are in flight, so a slow consumer (the embedding stage)
+    holds back loading instead of every file's chunks piling up in memory.
+    """
+    tasks = [(os.path.join(data_dir, f), f) for f in filenames]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) < 2:
+        yield from map(_load_and_chunk_file, tasks)
         return
+    workers = min(workers, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_load_and_chunk_file, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+@dataclass
+class PipelineStats:
+    """Item counts and busy time per pipeline stage."""
+    pages: int = 0
+    chunks: int = 0
+    load_seconds: float = 0.0
+    embeddings: int = 0
+    embed_seconds: float = 0.0
+    upserted: int = 0
+    upsert_seconds: float = 0.0
+    wall_seconds: float = 0.0
+
+    def report(self):
+        def rate(n, secs):
+            return f"{n / secs:8.1f}/s" if secs else "       -  "
+        print(f"\nThroughput (busy time per stage, {self.wall_seconds:.1f}s wall):")
+        print(f"  load + chunk: {rate(self.pages, self.load_seconds)} pages, "
+              f"{rate(self.chunks, self.load_seconds)} chunks  ({self.load_seconds:.1f}s)")
+        print(f"  embed:        {rate(self.embeddings, self.embed_seconds)} embeddings "
+              f"({self.embed_seconds:.1f}s)")
+        print(f"  upsert:       {rate(self.upserted, self.upsert_seconds)} chunks     "
+              f"({self.upsert_seconds:.1f}s)")
+        peak = peak_memory_mb()
+        print(f"  peak memory:  {peak:.0f} MB" if peak else "  peak memory:  n/a")
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def run_pipeline(batches, embeddings, collection, queue_size, timings):
+    """Embeds chunk batches and upserts each one as soon as it is ready.
+
+    `batches` yields (ids, chunks) lists. Loading, embedding and upserting run
+    as three stages joined by bounded queues, so at most `queue_size` batches
+    are held between any two stages no matter how large the corpus is.
+    """
+    done = object()
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_upsert = queue.Queue(maxsize=queue_size)
+
+    def produce():
+        try:
+            for batch in batches:
+                to_embed.put(batch)
+            to_embed.put(done)
+        except BaseException as e:  # surface loader errors in the main thread
+            to_embed.put(e)
+
+    def embed():
+        while True:
+            item = to_embed.get()
+            if item is done or isinstance(item, BaseException):
+                to_upsert.put(item)
+                return
+            ids, chunks = item
+            try:
+                start = time.perf_counter()
+                vectors = embeddings.embed_documents([c.page_content for c in chunks])
+                timings.embed_seconds += time.perf_counter() - start
+                timings.embeddings += len(vectors)
+            except BaseException as e:
+                to_upsert.put(e)
+                return
+            to_upsert.put((ids, chunks, vectors))
+
+    for target in (produce, embed):
+        threading.Thread(target=target, daemon=True).start()
+
+    while True:
+        item = to_upsert.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        ids, chunks, vectors = item
+        start = time.perf_counter()
+        collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[c.page_content for c in chunks],
+            metadatas=[c.metadata for c in chunks],
+        )
+        timings.upsert_seconds += time.perf_counter() - start
+        timings.upserted += len(ids)
+
+
+def read_collection(collection, include, page_size=EXPORT_PAGE_SIZE):
+    """Yields the collection's records page_size at a time, as get() returns them."""
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def build_lexical_index(collection, path):
+    """Rebuilds the BM25 inverted index over every chunk in the collection."""
+    index = BM25Index.build_paged(
+        lambda: ((page["ids"], page["documents"]) for page in read_collection(collection, ["documents"]))
+    )
+    index.save(path)
+    print(f"Built BM25 index over {len(index.doc_ids)} chunks ({os.path.getsize(path) // 1024} KB)")
+
 
-    # Wipe stale DB so we always have a clean, consistent store
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
-        print(f"Cleared old vector store at {CHROMA_PATH}")
+def export_vectors(collection, directory):
+    """Exports every chunk's embedding, text and metadata for RAGEngine's NumPy backend."""
+    count = collection.count()
+    pages = ((page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+             for page in read_collection(collection, ["embeddings", "documents", "metadatas"]))
+    size = save_vectors(directory, pages, count)
+    print(f"Exported {count} embeddings for the NumPy backend ({size // 1024} KB)")
+
+
+def file_hash(file_path):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(filename, count):
+    """Deterministic chunk IDs, so a file's old chunks can be found and replaced."""
+    return [f"{filename}#{i}" for i in range(count)]
+
+
+def load_manifest():
+    """Reads the ingestion manifest, or None if there isn't a usable one."""
+    try:
+        with open(os.path.join(CHROMA_PATH, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Chunks built with different settings can't be mixed with new ones
+    settings = {"embedding_model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    if manifest.get("settings") != settings:
+        return None
+    return manifest
+
+
+def save_manifest(files):
+    manifest = {
+        "settings": {"embedding_model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP},
+        "files": files,
+    }
+    tmp_path = os.path.join(CHROMA_PATH, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(CHROMA_PATH, MANIFEST_FILE))
+
+
+def sync_vector_store(data_dir, full_rebuild=False, workers=INGEST_WORKERS,
+                      batch_size=EMBED_BATCH_SIZE, queue_size=QUEUE_SIZE):
+    """Brings ChromaDB in line with data_dir, re-embedding only added or changed files.
+
+    Returns a dict of file and chunk counts per outcome (skipped/updated/deleted),
+    plus a PipelineStats under "pipeline".
+    """
+    stats = {"files_skipped": 0, "files_updated": 0, "files_deleted": 0, "files_failed": 0,
+             "chunks_skipped": 0, "chunks_updated": 0, "chunks_deleted": 0}
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+        print(f"Created '{data_dir}' directory. Please add documents there.")
+
+    manifest = None if full_rebuild else load_manifest()
+    if manifest is None:
+        # No manifest (or settings changed) — old chunk IDs are unknown, start clean
+        if os.path.exists(CHROMA_PATH):
+            shutil.rmtree(CHROMA_PATH)
+            print(f"Cleared old vector store at {CHROMA_PATH} (full rebuild)")
+        manifest = {"files": {}}
+    old_files = manifest["files"]
+
+    current = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if os.path.splitext(filename)[1].lower() in SUPPORTED_LOADERS:
+            current[filename] = file_hash(os.path.join(data_dir, filename))
+        else:
+            print(f"  Skipping unsupported file: {filename}")
+
+    changed = [f for f, h in current.items() if old_files.get(f, {}).get("hash") != h]
+    deleted = [f for f in old_files if f not in current]
+    new_files = {f: old_files[f] for f in current if f not in changed}
+    for filename, entry in new_files.items():
+        if entry.get("error"):
+            # Failed before with this exact content — retried once the file changes
+            stats["files_failed"] += 1
+            print(f"  Still failing: {filename} ({entry['error']}) — fix the file to retry")
+        else:
+            stats["files_skipped"] += 1
+        stats["chunks_skipped"] += len(entry["chunk_ids"])
+
+    timings = stats["pipeline"] = PipelineStats()
+    bm25_path = os.path.join(CHROMA_PATH, BM25_INDEX_FILE)
+    exports_missing = not (os.path.exists(bm25_path) and NumpyVectorStore.exists(CHROMA_PATH))
+    if not changed and not deleted and not exports_missing:
+        return stats
 
     print("Initializing embedding model (first run downloads ~80 MB)...")
     embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-
-    print(f"Creating vector store...")
-    Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=CHROMA_PATH,
+    collection = chromadb.PersistentClient(path=CHROMA_PATH).get_or_create_collection(
+        COLLECTION_NAME, embedding_function=None
     )
-    print(f"Successfully ingested {len(chunks)} chunks into ChromaDB at {CHROMA_PATH}")
+
+    # Drop chunks of deleted files; a changed file's old chunks go only once it has
+    # loaded, so a file that can't be read keeps serving its last good version
+    removed = 0
+    for filename in deleted:
+        stale_ids = old_files[filename].get("chunk_ids", [])
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+        removed += len(stale_ids)
+        stats["files_deleted"] += 1
+        stats["chunks_deleted"] += len(stale_ids)
+        print(f"  Deleted: {filename} ({len(stale_ids)} chunk(s))")
+
+    def batches():
+        """Regroups per-file chunks into fixed-size embedding batches."""
+        nonlocal removed
+        ids, chunks = [], []
+        files = load_and_chunk(data_dir, changed, workers=workers)
+        while True:
+            start = time.perf_counter()
+            result = next(files, None)
+            timings.load_seconds += time.perf_counter() - start
+            if result is None:
+                break
+            filename, file_chunks, pages, error = result
+            old_ids = old_files.get(filename, {}).get("chunk_ids", [])
+            if error:
+                stats["files_failed"] += 1
+                print(f"  Error loading {filename}: {error}")
+                # Recorded with its hash so unchanged runs don't retry (and re-index) it
+                new_files[filename] = {"hash": current[filename], "chunk_ids": old_ids, "error": error}
+                continue
+            file_ids = chunk_ids(filename, len(file_chunks))
+            # IDs are positional: the new chunks overwrite the old ones, the surplus goes
+            stale_ids = sorted(set(old_ids) - set(file_ids))
+            if stale_ids:
+                collection.delete(ids=stale_ids)
+                removed += len(stale_ids)
+            new_files[filename] = {"hash": current[filename], "chunk_ids": file_ids}
+            stats["files_updated"] += 1
+            stats["chunks_updated"] += len(file_chunks)
+            timings.pages += pages
+            timings.chunks += len(file_chunks)
+            print(f"  Updated: {filename} ({len(file_chunks)} chunk(s))")
+            ids.extend(file_ids)
+            chunks.extend(file_chunks)
+            while len(ids) >= batch_size:
+                yield ids[:batch_size], chunks[:batch_size]
+                ids, chunks = ids[batch_size:], chunks[batch_size:]
+        if ids:
+            yield ids, chunks
+
+    start = time.perf_counter()
+    run_pipeline(batches(), embeddings, collection, queue_size, timings)
+    timings.wall_seconds = time.perf_counter() - start
+
+    save_manifest(new_files)
+    if timings.upserted or removed or exports_missing:
+        build_lexical_index(collection, bm25_path)
+        export_vectors(collection, CHROMA_PATH)
+        # New stamp invalidates answers the running engine cached against the old index
+        bump_index_version(CHROMA_PATH)
+    return stats
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Ingest documents from data/ into ChromaDB.")
+    parser.add_argument("--full", action="store_true",
+                        help="wipe the vector store and re-embed every file")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="processes for loading + chunking (0 = one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="chunks per embedding batch / upsert")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="batches buffered between pipeline stages")
+    args = parser.parse_args()
+
     print(f"{'=' * 50}")
     print(f"  Document Ingestion Pipeline")
     print(f"{'=' * 50}")
-    print(f"\nLoading documents from {DATA_DIR}...")
-    documents = load_documents(DATA_DIR)
-
-    if documents:
-        print(f"\nTotal: {len(documents)} document pages loaded.")
-        chunks = chunk_documents(documents)
-        print(f"Split into {len(chunks)} chunks (size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP}).\n")
-        create_vector_store(chunks)
-    else:
+    print(f"\nSyncing documents from {DATA_DIR} ({'full rebuild' if args.full else 'incremental'})...")
+    stats = sync_vector_store(DATA_DIR, full_rebuild=args.full, workers=args.workers,
+                              batch_size=args.batch_size, queue_size=args.queue_size)
+
+    print(f"\nFiles:  {stats['files_skipped']} skipped, {stats['files_updated']} updated, "
+          f"{stats['files_deleted']} deleted, {stats['files_failed']} failed")
+    print(f"Chunks: {stats['chunks_skipped']} skipped, {stats['chunks_updated']} updated, "
+          f"{stats['chunks_deleted']} deleted (size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP})")
+    if stats["files_updated"]:
+        stats["pipeline"].report()
+    if not stats["files_skipped"] and not stats["files_updated"]:
         print("\nNo documents found. Add PDF, DOCX, or TXT files to the 'data/' folder.")
 
     print(f"\n{'=' * 50}")
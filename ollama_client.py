@@ -0,0 +1,70 @@
+import json
+
+import httpx
+
+# ── Async Ollama client ────────────────────────────────────────
+# Talks to /api/generate directly so a waiting request is a coroutine parked
+# on a socket instead of a thread. One pooled client is shared by every
+# request; connections to Ollama are reused between generations.
+MAX_CONNECTIONS = 64
+CONNECT_TIMEOUT = 10  # seconds
+
+# Counters Ollama reports on the final ("done") line; durations are nanoseconds
+EVAL_FIELDS = ("total_duration", "load_duration", "prompt_eval_count",
+               "prompt_eval_duration", "eval_count", "eval_duration")
+
+
+class AsyncOllamaClient:
+    """Streams completions from Ollama's /api/generate over a pooled httpx client."""
+
+    def __init__(self, base_url: str, model: str, options: dict, timeout: float,
+                 keep_alive=None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.options = options
+        self.keep_alive = keep_alive  # None = Ollama's default (5m)
+        self.timeout = httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+        self._client = None  # created on first use, inside the running event loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                ),
+            )
+        return self._client
+
+    async def stream(self, prompt: str, stats: dict = None):
+        """Yield response text chunks as Ollama produces them.
+
+        Ollama sends one JSON object per line; the last one has "done": true.
+        Its eval counters (EVAL_FIELDS) are copied into `stats` if given.
+        """
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "options": self.options}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        async with self._get_client().stream("POST", "/api/generate", json=payload) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode(errors="replace")
+                raise RuntimeError(f"Ollama returned {response.status_code}: {body[:200]}")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama error: {data['error']}")
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    if stats is not None:
+                        stats.update({k: data[k] for k in EVAL_FIELDS if k in data})
+                    break
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,11 +1,38 @@
 import os
+import time
+_import_start = time.perf_counter()
+import asyncio
+import threading
+import textwrap
 import requests
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_ollama import OllamaLLM
+import httpx
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
+
+from bm25 import BM25_INDEX_FILE, BM25Index, reciprocal_rank_fusion
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import ResponseCache, RetrievalCache, SemanticCache, read_index_version
+from context_packer import count_tokens, format_history, pack_context
+from hooks import CProfileHook
+from metrics import Counter, Gauge, Histogram
+from ollama_client import EVAL_FIELDS, AsyncOllamaClient
+from scheduler import LLMScheduler, QueueFullError
+from singleflight import SingleFlight
+from vector_index import NumpyVectorStore
+
+# langchain_chroma, langchain_huggingface (torch) and langchain_ollama take
+# seconds to import; they are imported inside RAGEngine's loaders instead, so
+# they load concurrently and `import rag_engine` stays cheap.
+IMPORT_SECONDS = time.perf_counter() - _import_start
 
 # ── Configuration ──────────────────────────────────────────────
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,6 +43,93 @@ OLLAMA_BASE_URL = "http://localhost:11434"
 
 OLLAMA_TIMEOUT = 300  # seconds — CPU inference can be slow
 
+# Model residency — Ollama unloads a model idle for keep_alive, and the next
+# question pays the full load again. A duration ("30m"), -1 to keep it loaded
+# for good, or 0 to unload after every answer.
+OLLAMA_KEEP_ALIVE = "30m"
+WARMUP_ON_START = True  # load the model and prefill the static prompt prefix at startup
+
+# Ollama health — a background monitor re-probes /api/tags, connects once
+# Ollama appears and trips the breaker when it stops answering. The breaker
+# opens after repeated timeouts/connection errors; while it is open, answers
+# are the retrieved source excerpts instead of waiting on a dead server.
+OLLAMA_MONITOR_INTERVAL = 15  # seconds between probes
+OLLAMA_PROBE_TIMEOUT = 5      # a probe slower than this counts as down
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_SECONDS = 30    # open -> one trial request after this long
+DEGRADED_EXCERPT_CHARS = 400
+
+# Profiling — attach a CProfileHook to this fraction of requests (0 = off);
+# results go into the request's debug trace and, if set, PROFILE_DIR
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = None
+RETRIEVAL_K = 4
+MAX_HISTORY = 4       # Keep last 4 messages (2 Q&A pairs) — reduced for speed
+
+# Startup — embeddings, Chroma, the Ollama probe and the tokenizer are brought up concurrently
+INIT_WORKERS = 4
+
+# Async path — embedding and Chroma search are blocking, so aquery() runs them
+# on a small dedicated pool instead of the event loop or Starlette's threadpool
+RETRIEVAL_WORKERS = 4
+
+# LLM scheduling — Ollama on CPU serves one generation at a time
+# (OLLAMA_NUM_PARALLEL=1), so extra requests wait in a bounded, per-client
+# fair queue instead of piling up inside the HTTP call until they time out.
+LLM_MAX_CONCURRENT = 1
+LLM_QUEUE_SIZE = 16           # requests allowed to wait; beyond this -> HTTP 429
+LLM_QUEUE_PER_CLIENT = 4      # waiting requests per client (API key / IP)
+LLM_QUEUE_TIMEOUT = 120       # seconds a request may wait for a slot
+
+# Token budget — the prompt must fit in num_ctx next to the generated answer
+NUM_CTX = 2048                # Lean context window for speed
+NUM_PREDICT = 1024            # Enough tokens for thorough answers
+ANSWER_TOKEN_RESERVE = 512    # window kept free for the answer (NUM_PREDICT is only a cap)
+HISTORY_TOKEN_BUDGET = 256    # recent conversation, newest messages first
+
+# Generation options — shared by OllamaLLM (sync path) and AsyncOllamaClient
+LLM_OPTIONS = {
+    "num_predict": NUM_PREDICT,
+    "temperature": 0.3,     # Lower = faster sampling, less randomness
+    "top_k": 20,            # Consider top 20 tokens
+    "top_p": 0.8,           # Nucleus sampling cutoff
+    "num_ctx": NUM_CTX,
+}
+
+# Dense retrieval backend: "chroma" (HNSW over chroma.sqlite3) or "numpy" —
+# exact brute-force search over the vectors-*.npy matrix that ingest.py
+# exports next to it. For a few thousand chunks one matrix product is faster.
+VECTOR_BACKEND = "chroma"
+
+# Hybrid retrieval — BM25 catches exact tokens (fees, route numbers, "CGPA")
+# that MiniLM embeds poorly; rankings are merged with reciprocal rank fusion.
+# The weights are the equal-weight defaults (with the usual RRF k=60) until a
+# benchmarks/bench_hybrid.py run with the real embedding model picks them —
+# see "Hybrid weight benchmark" in the README.
+RETRIEVAL_FETCH_K = 20        # candidates taken from each ranking before fusion
+HYBRID_DENSE_WEIGHT = 1.0
+HYBRID_LEXICAL_WEIGHT = 1.0
+RRF_K = 60
+
+# Post-retrieval selection — near-identical source files and CHUNK_OVERLAP=300
+# otherwise fill the 2048-token window with the same text several times.
+MMR_CANDIDATES = 12           # fused candidates considered for selection
+MMR_LAMBDA = 0.7              # 1.0 = pure relevance, 0.0 = pure diversity
+DUPLICATE_THRESHOLD = 0.95    # cosine above which a candidate is a near-duplicate
+MIN_OVERLAP_CHARS = 40        # shortest shared span worth stripping
+
+# Semantic answer cache — reuse answers for near-identical questions
+SEMANTIC_CACHE_SIZE = 256          # max cached answers (LRU eviction)
+SEMANTIC_CACHE_TTL = 3600          # seconds before a cached answer expires
+SEMANTIC_CACHE_THRESHOLD = 0.92    # min cosine similarity to count as a hit
+
+# Exact-match response cache — shared on disk by every API worker and app.py
+RESPONSE_CACHE_PATH = os.path.join(BASE_DIR, "response_cache.sqlite3")
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Query-embedding / retrieval-result cache — skips MiniLM + Chroma on repeats
+RETRIEVAL_CACHE_SIZE = 1024
+
 # Use cached model to avoid hanging on HuggingFace metadata checks
 os.environ.setdefault("HF_HUB_OFFLINE", "1")
 os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
@@ -310,45 +424,153 @@ SLANG_MAP = {
 }
 
 
+def _compile_slang(slang_map):
+    """Build a single-pass expander from SLANG_MAP.
+
+    Every key is a literal wrapped in \\b anchors, so all of them fold into one
+    alternation. Longer literals are tried first, which lets multi-word phrases
+    like "no cap" or "theek hai" win over their single-word prefixes.
+
+    The old loop applied the patterns one after another, so a replacement could
+    be expanded again by a later entry ("ngl" -> "not gonna lie" -> "not going
+    to lie"). That cascade is resolved here once, at import time.
+    """
+    entries = [(p, r, re.compile(p, re.IGNORECASE)) for p, r in slang_map.items()]
+    replacements = {}
+    for i, (pattern, replacement, _) in enumerate(entries):
+        for _, later_replacement, later_regex in entries[i + 1:]:
+            replacement = later_regex.sub(later_replacement, replacement)
+        replacements.setdefault(pattern[2:-2].lower(), replacement)
+
+    alternation = "|".join(
+        re.escape(literal) for literal in sorted(replacements, key=len, reverse=True)
+    )
+    return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE), replacements
+
+
+_SLANG_REGEX, _SLANG_REPLACEMENTS = _compile_slang(SLANG_MAP)
+
+
 def _expand_slang(text: str) -> str:
     """Replace slang and abbreviations with full forms (case-insensitive)."""
-    result = text
-    for pattern, replacement in SLANG_MAP.items():
-        result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
-    return result
-
-
-def _strip_think(text: str) -> str:
-    """Remove <think>...</think> blocks from qwen3 model output.
-    
-    Qwen3 models wrap internal reasoning in <think> tags when using the
-    raw /api/generate endpoint (which LangChain's OllamaLLM uses).
-    The actual answer appears AFTER the closing </think> tag.
+    return _SLANG_REGEX.sub(
+        lambda m: _SLANG_REPLACEMENTS.get(m.group(0).lower(), m.group(0)), text
+    )
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """Length of the longest proper prefix of `tag` that `text` ends with."""
+    for n in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text[-n:].lower() == tag[:n]:
+            return n
+    return 0
+
+
+class _ThinkFilter:
+    """Removes <think>...</think> blocks from a streamed answer as it arrives.
+
+    Qwen3 models wrap internal reasoning in <think> tags when using the raw
+    /api/generate endpoint; the answer is what's outside them. A two-state
+    machine (outside / inside a block) that only holds back the few
+    characters that may start a tag split across chunks, so each chunk costs
+    time proportional to its own length. Shared by the sync and async
+    streaming paths: feed() each chunk and emit what it returns, then
+    flush(); result() is the cleaned full answer.
     """
-    if '<think>' not in text:
+
+    OPEN, CLOSE = "<think>", "</think>"
+    _OPEN_RE = re.compile(re.escape(OPEN), re.IGNORECASE)
+    _CLOSE_RE = re.compile(re.escape(CLOSE), re.IGNORECASE)
+
+    def __init__(self):
+        self.chunks = 0          # raw chunks fed (≈ generated tokens)
+        self._parts = []         # emitted answer text
+        self._pending = ""       # possible partial tag at the end of the last chunk
+        self._inside = False
+        self._started = False    # leading whitespace is dropped until text appears
+
+    def feed(self, chunk: str) -> str:
+        self.chunks += 1
+        text, self._pending = self._pending + chunk, ""
+        out = []
+        while text:
+            if self._inside:
+                match = self._CLOSE_RE.search(text)
+                if not match:
+                    keep = _partial_tag(text, self.CLOSE)
+                    self._pending = text[len(text) - keep:]
+                    break
+                text, self._inside = text[match.end():], False
+            else:
+                match = self._OPEN_RE.search(text)
+                if not match:
+                    keep = _partial_tag(text, self.OPEN)
+                    out.append(text[:len(text) - keep])
+                    self._pending = text[len(text) - keep:]
+                    break
+                out.append(text[:match.start()])
+                text, self._inside = text[match.end():], True
+        return self._emit("".join(out))
+
+    def flush(self) -> str:
+        """End of stream: release held-back text (an unclosed block is dropped)."""
+        text, self._pending = self._pending, ""
+        return "" if self._inside else self._emit(text)
+
+    def filter(self, chunks):
+        """Filtered, non-empty text for an iterable of chunks, flushed at the end."""
+        for chunk in chunks:
+            text = self.feed(chunk)
+            if text:
+                yield text
+        text = self.flush()
+        if text:
+            yield text
+
+    async def afilter(self, chunks):
+        """filter() for an async iterable of chunks."""
+        async for chunk in chunks:
+            text = self.feed(chunk)
+            if text:
+                yield text
+        text = self.flush()
+        if text:
+            yield text
+
+    def result(self) -> str:
+        return "".join(self._parts).rstrip()
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        if text:
+            self._parts.append(text)
         return text
-    # Remove complete <think>...</think> blocks
-    cleaned = re.sub(r'<think>[\s\S]*?</think>', '', text, flags=re.IGNORECASE).strip()
-    # Handle unclosed <think> tag (model still thinking when tokens ran out)
-    if '<think>' in cleaned:
-        cleaned = re.sub(r'<think>[\s\S]*$', '', cleaned, flags=re.IGNORECASE).strip()
-    return cleaned
 
 
 # ── Optimized prompt: concise to reduce token count ───────────
+# The static instructions are the byte-identical prefix of every prompt —
+# nothing per-request (history, context, question) may come before or inside
+# them — so Ollama reuses the KV cache it already computed for them instead
+# of re-evaluating ~190 tokens on each request. warm_up() primes that cache.
+RAG_SYSTEM_PROMPT = (
+    "You are KRMAI, an AI assistant for KR Mangalam University students.\n"
+    "Respond ONLY in English, even if the user writes in Hindi/Hinglish.\n\n"
+    "Rules:\n"
+    "- Respond DIRECTLY. Do NOT output <think> blocks or any internal reasoning.\n"
+    "- Use ONLY the context below to answer. Do NOT make up information.\n"
+    "- If the question has multiple parts, answer ALL parts thoroughly.\n"
+    "- Use bullet points, numbered lists, or tables to structure your answer.\n"
+    "- Include specific names, numbers, and details from the context.\n"
+    "- If context lacks the answer for any part, say so for that specific part.\n"
+    "- NEVER stop mid-sentence. Always complete your response.\n\n"
+)
+
 RAG_PROMPT = PromptTemplate(
     template=(
-        "You are KRMAI, an AI assistant for KR Mangalam University students.\n"
-        "Respond ONLY in English, even if the user writes in Hindi/Hinglish.\n\n"
-        "Rules:\n"
-        "- Respond DIRECTLY. Do NOT output <think> blocks or any internal reasoning.\n"
-        "- Use ONLY the context below to answer. Do NOT make up information.\n"
-        "- If the question has multiple parts, answer ALL parts thoroughly.\n"
-        "- Use bullet points, numbered lists, or tables to structure your answer.\n"
-        "- Include specific names, numbers, and details from the context.\n"
-        "- If context lacks the answer for any part, say so for that specific part.\n"
-        "- NEVER stop mid-sentence. Always complete your response.\n\n"
-        "{chat_history}"
+        RAG_SYSTEM_PROMPT
+        + "{chat_history}"
         "Context:\n{context}\n\n"
         "Question: {question}\n\n"
         "Answer:"
@@ -362,62 +584,467 @@ def _format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
 
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b`."""
+    if len(b) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = b[:MIN_OVERLAP_CHARS]
+    start = a.find(probe)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def _strip_overlaps(docs):
+    """Trim text a chunk shares with the end or start of an already kept chunk.
+
+    Adjacent chunks of the same file repeat up to CHUNK_OVERLAP characters.
+    Returns new Document objects; cached ones are never modified.
+    """
+    kept = []
+    for doc in docs:
+        text = doc.page_content
+        for other in kept:
+            head = _overlap(other.page_content, text)   # other ... | text
+            if head:
+                text = text[head:].lstrip()
+            tail = _overlap(text, other.page_content)   # text ... | other
+            if tail:
+                text = text[:-tail].rstrip()
+        if text:
+            kept.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+    return kept
+
+
+def _degraded_answer(docs) -> str:
+    """Answer built from retrieved excerpts when the LLM can't be reached."""
+    if not docs:
+        return ("The answer service is temporarily unavailable and no matching documents "
+                "were found. Please try again in a minute.")
+    lines = ["The answer service is temporarily unavailable, so here are the most relevant "
+             "excerpts from the university documents:\n"]
+    for doc in docs:
+        excerpt = textwrap.shorten(doc.page_content, DEGRADED_EXCERPT_CHARS, placeholder=" …")
+        lines.append(f"- **{doc.metadata.get('source', 'Unknown')}**: {excerpt}")
+    return "\n".join(lines)
+
+
+class _EvalStats(BaseCallbackHandler):
+    """Copies Ollama's eval counters from the final streamed chunk into ctx."""
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def on_llm_end(self, response, **kwargs):
+        if not response.generations:
+            return
+        info = response.generations[0][0].generation_info or {}
+        self.ctx.llm_stats.update({k: info[k] for k in EVAL_FIELDS if info.get(k) is not None})
+
+
+# Errors that mean Ollama itself is unreachable or hung — these count against
+# the circuit breaker (HTTP errors from a live server don't)
+_LLM_UNAVAILABLE = (httpx.TransportError, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout, ConnectionError, TimeoutError)
+
+
+def _replay_tokens(answer: str):
+    """Split a cached answer into word-sized chunks so it streams like a live one."""
+    return re.findall(r"\s*\S+\s*", answer) or [answer]
+
+
+# ── Metrics ────────────────────────────────────────────────────
+# Recorded by RAGEngine itself, so the API and Streamlit share them;
+# api.py serves them at /metrics.
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent per query stage (slang, history, cache_lookup, embed, retrieval = vector+BM25 "
+    "search, prompt_build, queue_wait).",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    labels=("stage",),
+)
+TTFT_SECONDS = Histogram(
+    "rag_time_to_first_token_seconds",
+    "Time from receiving a question to the first answer token (LLM answers only).",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120),
+)
+GENERATION_SECONDS = Histogram(
+    "rag_generation_seconds",
+    "Time spent streaming the answer from the LLM.",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+TOKENS_PER_SECOND = Histogram(
+    "rag_generation_tokens_per_second",
+    "LLM output rate of each generation (streamed chunks per second).",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200),
+)
+REQUESTS = Counter("rag_requests_total", "Questions received.", labels=("kind",))
+ERRORS = Counter("rag_request_errors_total", "Questions that failed with an error.",
+                 labels=("error",))
+CACHE_HITS = Counter("rag_cache_hits_total", "Questions answered from the response/semantic cache.")
+COALESCED = Counter("rag_coalesced_requests_total",
+                    "Questions that shared an identical in-flight generation.")
+DEGRADED = Counter("rag_degraded_responses_total",
+                   "Questions answered with source excerpts while the circuit breaker was open.")
+QUEUE_REJECTIONS = Counter("rag_queue_rejections_total",
+                           "Questions rejected because the LLM queue was full or timed out.")
+INFLIGHT_STREAMS = Gauge("rag_inflight_streams", "Streaming answers currently being sent.")
+
+
+@dataclass
+class RequestContext:
+    """Everything one query carries from question to answer.
+
+    The engine keeps no per-conversation state: history comes in here, and
+    the retrieved docs, token counts and stage timings (ms) come back here,
+    so concurrent requests on a shared engine never see each other's data.
+    """
+    question: str
+    history: list = field(default_factory=list)   # messages before this question
+    client_id: str = "anonymous"                   # fair-queueing key for the LLM scheduler
+    chat_history: str = ""                         # history as rendered into the prompt
+    index_version: str = ""
+    cache_key: str = ""
+    query_embedding: Any = None
+    prompt: Optional[str] = None
+    answer: Optional[str] = None
+    cached: bool = False
+    degraded: bool = False                         # LLM unavailable — answer is source excerpts
+    coalesced: bool = False                        # shared an identical in-flight generation
+    source_documents: list = field(default_factory=list)
+    context_stats: Optional[dict] = None           # None when answered from cache
+    prompt_tokens: Optional[dict] = None
+    completion_tokens: int = 0                     # chunks streamed by the LLM (leader only)
+    llm_stats: dict = field(default_factory=dict)  # Ollama eval counters (leader only)
+    timings: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)      # added by request hooks, e.g. a profile
+    started: float = field(default_factory=time.perf_counter)
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        # A stage timed more than once adds up
+        self.timings[stage] = round(self.timings.get(stage, 0) + seconds * 1000, 2)
+
+    def first_token(self):
+        """Note the time to first token — call on every chunk, only the first counts."""
+        if "first_token" not in self.timings:
+            self.record("first_token", time.perf_counter() - self.started)
+
+    def updated_history(self) -> list:
+        """History to send with the next question in this conversation."""
+        messages = list(self.history)
+        if self.answer is not None:
+            messages.append({"role": "user", "content": self.question})
+            messages.append({"role": "assistant", "content": self.answer})
+        return messages[-MAX_HISTORY:]
+
+    def result(self) -> dict:
+        return {
+            "answer": self.answer,
+            "source_documents": self.source_documents,
+            "context_stats": self.context_stats,
+            "prompt_tokens": self.prompt_tokens,
+            "history": self.updated_history(),
+            "timings": self.timings,
+            "degraded": self.degraded,
+            "trace": self.trace(),
+        }
+
+    def trace(self) -> dict:
+        """Debug view of the request: where the time went and what the LLM was given."""
+        in_prompt = {doc.id for doc in self.source_documents}
+        stats = self.context_stats or {}
+        return {
+            "stages_ms": dict(self.timings),
+            "prompt_chars": len(self.prompt) if self.prompt else 0,
+            "prompt_tokens": self.prompt_tokens,
+            # Context characters kept out by overlap stripping and MMR deduplication
+            "context_chars": {key: stats[key] for key in
+                              ("chars_after", "chars_stripped", "chars_duplicate", "chars_saved")
+                              if key in stats},
+            "chunks": [
+                {**chunk, "in_prompt": chunk["id"] in in_prompt}
+                for chunk in stats.get("chunks", [])
+            ],
+            "completion_chunks": self.completion_tokens,
+            "ollama": dict(self.llm_stats),
+            "cached": self.cached,
+            "coalesced": self.coalesced,
+            "degraded": self.degraded,
+            **self.extra,
+        }
+
+
+def _observe(ctx: RequestContext):
+    """Record a finished request's timings (ms in ctx) in the metrics (seconds)."""
+    timings = ctx.timings
+    for stage in ("slang", "history", "cache_lookup", "embed", "retrieval", "prompt_build", "queue_wait"):
+        if stage in timings:
+            STAGE_SECONDS.observe(timings[stage] / 1000, stage=stage)
+    if ctx.cached:
+        CACHE_HITS.inc()
+    if ctx.coalesced:
+        COALESCED.inc()
+    if ctx.degraded:
+        DEGRADED.inc()
+    if ctx.cached or ctx.degraded:
+        return  # no LLM involved
+    if "first_token" in timings:
+        TTFT_SECONDS.observe(timings["first_token"] / 1000)
+    if "generation" in timings:
+        seconds = timings["generation"] / 1000
+        GENERATION_SECONDS.observe(seconds)
+        if ctx.completion_tokens and seconds > 0:
+            TOKENS_PER_SECOND.observe(ctx.completion_tokens / seconds)
+
+
+class HybridRetriever:
+    """Fuses dense (Chroma) and lexical (BM25) rankings with weighted RRF.
+
+    Falls back to dense-only results when ingest.py hasn't built a BM25 index.
+    The index is reloaded whenever the index version stamp changes.
+
+    The fused candidates then go through maximal-marginal-relevance selection,
+    using the chunk embeddings already stored in Chroma, and shared spans
+    between the chosen chunks are stripped.
+    """
+
+    def __init__(self, retrieval_cache, chroma_path, k=RETRIEVAL_K,
+                 dense_weight=HYBRID_DENSE_WEIGHT, lexical_weight=HYBRID_LEXICAL_WEIGHT):
+        self.retrieval_cache = retrieval_cache
+        self.chroma_path = chroma_path
+        self.k = k
+        self.dense_weight = dense_weight
+        self.lexical_weight = lexical_weight
+        self.bm25 = None
+        self._version = None
+        self._lock = threading.Lock()  # one reload, however many requests see the new stamp
+
+    def search(self, question: str, query_embedding):
+        """Return (docs, stats); stats reports the prompt characters saved."""
+        rankings = [[d.id for d in self.retrieval_cache.search(query_embedding)]]
+        weights = [self.dense_weight]
+        bm25_scores = {}
+        bm25 = self._load_index()
+        if bm25 is not None and self.lexical_weight:
+            bm25_scores = dict(bm25.search(question, RETRIEVAL_FETCH_K))
+            rankings.append(list(bm25_scores))
+            weights.append(self.lexical_weight)
+        elif not self.dense_weight:
+            weights = [1.0]
+        fused = reciprocal_rank_fusion(rankings, weights, k=RRF_K)[:MMR_CANDIDATES]
+
+        candidates = self.retrieval_cache.get_documents([doc_id for doc_id, _ in fused])
+        relevance = dict(fused)
+        chosen, duplicates = self._mmr(candidates, relevance)
+        selected = _strip_overlaps(chosen)
+
+        # Savings on the chunks themselves: spans stripped from the chosen ones,
+        # plus top-k chunks left out as near-duplicates of a chosen one
+        chars_after = sum(len(d.page_content) for d in selected)
+        chars_stripped = sum(len(d.page_content) for d in chosen) - chars_after
+        chars_duplicate = sum(len(d.page_content) for d in duplicates)
+        dense_ranks = {doc_id: rank for rank, doc_id in enumerate(rankings[0], start=1)}
+        return selected, {
+            "candidates": len(candidates),
+            "chars_after": chars_after,
+            "chars_stripped": chars_stripped,
+            "chars_duplicate": chars_duplicate,
+            "chars_saved": chars_stripped + chars_duplicate,
+            "chunks": [
+                {
+                    "id": d.id,
+                    "source": d.metadata.get("source", "Unknown"),
+                    "fused_score": round(relevance[d.id], 6),
+                    "dense_rank": dense_ranks.get(d.id),
+                    "bm25_score": round(bm25_scores[d.id], 4) if d.id in bm25_scores else None,
+                }
+                for d in selected
+            ],
+        }
+
+    def _mmr(self, candidates, relevance):
+        """Pick k candidates balancing fused relevance against redundancy.
+
+        Returns (chosen, duplicates): the picks, and the plain top-k candidates
+        that were skipped as near-duplicates of a pick.
+        """
+        if len(candidates) <= 1:
+            return candidates, []
+        vectors = self.retrieval_cache.get_embeddings([d.id for d in candidates])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+        top = max(relevance.values())
+        scores = np.array([relevance[d.id] / top for d in candidates])
+
+        chosen = [0]  # the best fused candidate always goes first
+        redundancy = similarity[0].copy()
+        while len(chosen) < self.k:
+            mmr = MMR_LAMBDA * scores - (1 - MMR_LAMBDA) * redundancy
+            mmr[chosen] = -np.inf
+            mmr[redundancy >= DUPLICATE_THRESHOLD] = -np.inf
+            best = int(np.argmax(mmr))
+            if mmr[best] == -np.inf:
+                break
+            chosen.append(best)
+            redundancy = np.maximum(redundancy, similarity[best])
+        duplicates = [candidates[i] for i in range(min(self.k, len(candidates)))
+                      if i not in chosen and redundancy[i] >= DUPLICATE_THRESHOLD]
+        return [candidates[i] for i in chosen], duplicates
+
+    def _load_index(self):
+        version = read_index_version(self.chroma_path)
+        with self._lock:
+            if version != self._version:
+                path = os.path.join(self.chroma_path, BM25_INDEX_FILE)
+                try:
+                    self.bm25 = _PRELOADED.get(("bm25", path, version)) or BM25Index.load(path)
+                except (OSError, ValueError, KeyError):
+                    self.bm25 = None
+                    print(f"[RAG] No BM25 index at {path} — dense retrieval only. Run ingest.py.")
+                self._version = version
+            return self.bm25
+
+
+class _DeferredEmbeddings(Embeddings):
+    """Stands in for the embedding model while it loads, so Chroma can be
+    opened at the same time."""
+
+    def __init__(self, future):
+        self._future = future
+
+    def embed_query(self, text):
+        return self._future.result().embed_query(text)
+
+    def embed_documents(self, texts):
+        return self._future.result().embed_documents(texts)
+
+
+# ── Preloading ─────────────────────────────────────────────────
+# Filled by preload() in a parent process that then forks workers (serve.py):
+# each worker's RAGEngine picks these up instead of loading its own copy, and
+# the pages stay shared copy-on-write. Keyed so a changed setting reloads.
+_PRELOADED = {}
+
+
+def preload() -> float:
+    """Import the heavy libraries and load the embedding model, BM25 index,
+    token counter and — with the NumPy backend — the mapped vector export into
+    this process. Returns the seconds taken.
+
+    Nothing here starts a thread or opens a database connection, so it is
+    safe to fork afterwards; Chroma and Ollama are still opened per worker.
+    """
+    start = time.perf_counter()
+    import langchain_chroma  # noqa: F401 — import cost only, no client yet
+    import langchain_ollama  # noqa: F401
+    from langchain_huggingface import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    _PRELOADED[("embeddings", EMBEDDING_MODEL)] = embeddings
+
+    path = os.path.join(CHROMA_PATH, BM25_INDEX_FILE)
+    try:
+        _PRELOADED[("bm25", path, read_index_version(CHROMA_PATH))] = BM25Index.load(path)
+    except (OSError, ValueError, KeyError):
+        pass  # the engine reports the missing index itself
+    if VECTOR_BACKEND == "numpy" and NumpyVectorStore.exists(CHROMA_PATH):
+        try:
+            _PRELOADED[("numpy", CHROMA_PATH)] = NumpyVectorStore(CHROMA_PATH, embeddings)
+        except (OSError, ValueError, KeyError):
+            pass
+    count_tokens(RAG_PROMPT.format(context="", question="", chat_history=""))
+    return time.perf_counter() - start
+
+
 class RAGEngine:
-    """Retrieval-Augmented Generation engine backed by ChromaDB + Ollama."""
+    """Retrieval-Augmented Generation engine backed by ChromaDB + Ollama.
 
-    def __init__(self):
+    With background=True the constructor returns at once and the components
+    come up on a worker thread; `status` and `components` show progress.
+    """
+
+    def __init__(self, background: bool = False):
+        self.embeddings = None
         self.vector_store = None
         self.retriever = None
+        self.retrieval_cache = None
+        self.hybrid_retriever = None
         self.llm = None
+        self.async_llm = None
         self.qa_chain = None
-        self.chat_history = []  # Stores last N messages for conversational memory
-        self.max_history = 4    # Keep last 4 messages (2 Q&A pairs) — reduced for speed
         self.status = {"db": False, "ollama": False, "ready": False}
-        self._initialize()
+        # Per-component readiness and load times (seconds), reported by /health
+        self.components = {
+            name: {"ready": False, "error": None, "timings": {}}
+            for name in ("embeddings", "vector_store", "ollama", "tokenizer")
+        }
+        self.startup_seconds = None
+        self.initialized = threading.Event()
+        self.answer_cache = SemanticCache(
+            max_entries=SEMANTIC_CACHE_SIZE,
+            ttl=SEMANTIC_CACHE_TTL,
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+        )
+        self.response_cache = ResponseCache(RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES)
+        self.scheduler = LLMScheduler(
+            max_concurrent=LLM_MAX_CONCURRENT,
+            max_queue=LLM_QUEUE_SIZE,
+            max_per_client=LLM_QUEUE_PER_CLIENT,
+            timeout=LLM_QUEUE_TIMEOUT,
+        )
+        self.flights = SingleFlight()
+        self.breaker = CircuitBreaker(
+            failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS
+        )
+        self._stop = threading.Event()
+        self.hooks = []
+        if PROFILE_SAMPLE_RATE:
+            self.add_hook(CProfileHook(PROFILE_SAMPLE_RATE, PROFILE_DIR))
+        self._executor = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_WORKERS, thread_name_prefix="rag-retrieval"
+        )
+        if background:
+            threading.Thread(target=self._initialize, name="rag-init", daemon=True).start()
+        else:
+            self._initialize()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Block until initialization has finished; returns status["ready"]."""
+        self.initialized.wait(timeout)
+        return self.status["ready"]
 
     # ── Setup ──────────────────────────────────────────────────
     def _initialize(self):
-        # 1. Embeddings (runs locally via sentence-transformers)
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-
-        # 2. Vector store
-        if os.path.exists(CHROMA_PATH) and os.listdir(CHROMA_PATH):
-            try:
-                self.vector_store = Chroma(
-                    persist_directory=CHROMA_PATH,
-                    embedding_function=self.embeddings,
-                )
-                # k=4 — enough docs to cover multi-topic queries (bus routes + placements etc.)
-                self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 4})
-                self.status["db"] = True
-            except Exception as e:
-                print(f"[RAG] Error loading vector store: {e}")
-        else:
-            print("[RAG] ChromaDB not found — run ingest.py first.")
-
-        # 3. Ollama LLM — optimized parameters for speed
-        if self._ollama_is_running():
-            try:
-                self.llm = OllamaLLM(
-                    model=LLM_MODEL,
-                    base_url=OLLAMA_BASE_URL,
-                    timeout=OLLAMA_TIMEOUT,
-                    # ── Tuned for qwen3:4b on CPU: fast + complete ──
-                    num_predict=1024,    # Enough tokens for thorough answers
-                    temperature=0.3,     # Lower = faster sampling, less randomness
-                    top_k=20,            # Consider top 20 tokens
-                    top_p=0.8,           # Nucleus sampling cutoff
-                    num_ctx=2048,        # Lean context window for speed
-                )
-                self.status["ollama"] = True
-                print(f"[RAG] Ollama connected: {LLM_MODEL}")
-            except Exception as e:
-                print(f"[RAG] Error initializing Ollama: {e}")
-        else:
-            print("[RAG] Ollama is not running. Start it with: ollama serve")
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=INIT_WORKERS, thread_name_prefix="rag-init") as pool:
+                embeddings = pool.submit(self._load_embeddings)
+                vector_store = pool.submit(self._open_vector_store, embeddings)
+                ollama = pool.submit(self._connect_ollama)
+                tokenizer = pool.submit(self._load_tokenizer)
+                self._build_retrieval(embeddings.result(), vector_store.result())
+                ollama.result()
+                tokenizer.result()
+            self._build_chain()
+        finally:
+            self.startup_seconds = round(time.perf_counter() - start, 2)
+            self._print_startup_profile()
+            self.initialized.set()
+        if OLLAMA_MONITOR_INTERVAL:
+            threading.Thread(target=self._monitor_ollama, name="ollama-monitor", daemon=True).start()
 
+    def _build_chain(self):
         # 4. RAG chain (using LCEL instead of deprecated RetrievalQA)
-        if self.llm and self.retriever:
+        if self.llm and self.retriever and not self.qa_chain:
             self.qa_chain = (
                 {
                     "context": self.retriever | _format_docs,
@@ -429,121 +1056,570 @@ class RAGEngine:
             )
             self.status["ready"] = True
 
+    def _load_embeddings(self):
+        # 1. Embeddings (runs locally via sentence-transformers)
+        try:
+            embeddings = _PRELOADED.get(("embeddings", EMBEDDING_MODEL))
+            if embeddings is None:
+                with self._timed("embeddings", "import"):
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                with self._timed("embeddings", "load"):
+                    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+            self.components["embeddings"]["ready"] = True
+            return embeddings
+        except Exception as e:
+            self._failed("embeddings", f"Error loading embedding model: {e}")
+            return None
+
+    def _load_tokenizer(self):
+        # 5. Token counter — the LLM's tokenizer would otherwise load on the first request
+        with self._timed("tokenizer", "load"):
+            count_tokens(RAG_PROMPT.format(context="", question="", chat_history=""))
+        self.components["tokenizer"]["ready"] = True
+
+    def _open_vector_store(self, embeddings_future):
+        # 2. Vector store — opened while the embedding model is still loading
+        if not (os.path.exists(CHROMA_PATH) and os.listdir(CHROMA_PATH)):
+            self._failed("vector_store", "ChromaDB not found — run ingest.py first.")
+            return None
+        if VECTOR_BACKEND == "numpy":
+            return self._open_numpy_store(embeddings_future)
+        try:
+            with self._timed("vector_store", "import"):
+                from langchain_chroma import Chroma
+            with self._timed("vector_store", "load"):
+                vector_store = Chroma(
+                    persist_directory=CHROMA_PATH,
+                    embedding_function=_DeferredEmbeddings(embeddings_future),
+                )
+            self.components["vector_store"]["ready"] = True
+            return vector_store
+        except Exception as e:
+            self._failed("vector_store", f"Error loading vector store: {e}")
+            return None
+
+    def _open_numpy_store(self, embeddings_future):
+        if not NumpyVectorStore.exists(CHROMA_PATH):
+            self._failed("vector_store", "No vector export in chroma_db/ — run ingest.py.")
+            return None
+        try:
+            with self._timed("vector_store", "load"):
+                vector_store = (_PRELOADED.get(("numpy", CHROMA_PATH))
+                                or NumpyVectorStore(CHROMA_PATH, _DeferredEmbeddings(embeddings_future)))
+            self.components["vector_store"]["ready"] = True
+            return vector_store
+        except Exception as e:
+            self._failed("vector_store", f"Error loading vector store: {e}")
+            return None
+
+    def _build_retrieval(self, embeddings, vector_store):
+        if embeddings is None or vector_store is None:
+            return
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        # k=4 — enough docs to cover multi-topic queries (bus routes + placements etc.)
+        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+        self.retrieval_cache = RetrievalCache(
+            self.vector_store, self.embeddings, k=RETRIEVAL_FETCH_K,
+            chroma_path=CHROMA_PATH, max_entries=RETRIEVAL_CACHE_SIZE,
+            reopen=self._reopen_vector_store,
+        )
+        self.hybrid_retriever = HybridRetriever(self.retrieval_cache, CHROMA_PATH)
+        self.status["db"] = True
+
+    def _reopen_vector_store(self, version: str):
+        """Fresh Chroma client once ingest.py has stamped a new index version.
+
+        An open client keeps serving the collection it loaded — even one a full
+        rebuild has deleted — so the API would never see the new index.
+        """
+        if VECTOR_BACKEND == "numpy" or not version or version.startswith("mtime:"):
+            return None  # the NumPy store reloads itself; no stamp yet = ingest still running
+        try:
+            from chromadb.api.client import Client
+            from langchain_chroma import Chroma
+            # Clients are cached per path; without this the same stale one comes back
+            Client.clear_system_cache()
+            vector_store = Chroma(persist_directory=CHROMA_PATH, embedding_function=self.embeddings)
+        except Exception as e:
+            print(f"[RAG] Could not reopen the vector store: {e}")
+            return None
+        print(f"[RAG] Index version {version} — reopened the vector store")
+        self.vector_store = vector_store
+        return vector_store
+
+    def _connect_ollama(self):
+        # 3. Ollama LLM — optimized parameters for speed
+        with self._timed("ollama", "probe"):
+            running = self._ollama_is_running()
+        if not running:
+            self._failed("ollama", "Ollama is not running. Start it with: ollama serve")
+            return
+        try:
+            with self._timed("ollama", "import"):
+                from langchain_ollama import OllamaLLM
+            self.llm = OllamaLLM(
+                model=LLM_MODEL,
+                base_url=OLLAMA_BASE_URL,
+                timeout=OLLAMA_TIMEOUT,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                **LLM_OPTIONS,
+            )
+            self.async_llm = AsyncOllamaClient(
+                OLLAMA_BASE_URL, LLM_MODEL, LLM_OPTIONS,
+                timeout=OLLAMA_TIMEOUT, keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            self.status["ollama"] = True
+            self.components["ollama"].update(ready=True, error=None)  # a failed earlier probe is over
+            print(f"[RAG] Ollama connected: {LLM_MODEL}")
+            if WARMUP_ON_START:
+                # In the background — requests that arrive first just queue in Ollama
+                threading.Thread(
+                    target=self._warm_up_quietly, name="ollama-warmup", daemon=True
+                ).start()
+        except Exception as e:
+            self._failed("ollama", f"Error initializing Ollama: {e}")
+
+    @contextmanager
+    def _timed(self, component: str, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.components[component]["timings"][phase] = round(time.perf_counter() - start, 2)
+
+    def _failed(self, component: str, message: str):
+        self.components[component]["error"] = message
+        print(f"[RAG] {message}")
+
+    def _print_startup_profile(self):
+        print(f"[RAG] Startup profile — {self.startup_seconds:.2f}s wall "
+              f"(rag_engine import {IMPORT_SECONDS:.2f}s before that):")
+        for name, info in self.components.items():
+            phases = "  ".join(f"{phase} {secs:.2f}s" for phase, secs in info["timings"].items())
+            state = "ready" if info["ready"] else "FAILED"
+            print(f"[RAG]   {name:<13} {state:<6}  {phases}")
+
     # ── Public API ─────────────────────────────────────────────
-    def query(self, question: str, history: list = None):
-        """Ask a question. Returns dict with answer + sources, or error string."""
+    # The engine is shared by every request (API workers' threads, Streamlit
+    # sessions); all per-request state lives in a RequestContext.
+    def query(self, question: str, history: list = None, client_id: str = None):
+        """Ask a question. Returns dict with answer, sources, updated history
+        and timings, or an error string.
+
+        Raises QueueFullError when the LLM queue can't take the request.
+        """
         if not self.qa_chain:
-            parts = []
-            if not self.status["db"]:
-                parts.append("Vector database not found — run 'python ingest.py' first.")
-            if not self.status["ollama"]:
-                parts.append("Ollama is not running — start it with 'ollama serve'.")
-            return " | ".join(parts) if parts else "System not initialized."
+            return self._not_ready_message()
 
-        # Expand slang/abbreviations so retrieval finds the right docs
-        cleaned_question = _expand_slang(question)
-
-        # Build chat history string from provided history or internal buffer
-        if history:
-            self.chat_history = history[-self.max_history:]
-        chat_history_str = ""
-        if self.chat_history:
-            chat_history_str = "Recent conversation:\n"
-            for msg in self.chat_history:
-                role = "Student" if msg["role"] == "user" else "Assistant"
-                # Truncate long messages in history to save context tokens
-                content = msg['content'][:200] if len(msg['content']) > 200 else msg['content']
-                chat_history_str += f"{role}: {content}\n"
-            chat_history_str += "\n"
-
-        # Retrieve source documents for citations
-        assert self.retriever is not None  # guaranteed when qa_chain is set
-        source_docs = self.retriever.invoke(cleaned_question)
-
-        # Build prompt inputs and invoke LLM directly (not via chain — avoids double retrieval)
-        context = _format_docs(source_docs)
-        prompt_text = RAG_PROMPT.format(
-            context=context,
-            question=cleaned_question,
-            chat_history=chat_history_str,
-        )
-        answer = _strip_think(self.llm.invoke(prompt_text))
+        ctx = self._new_context(question, history, client_id=client_id)
+        with self._instrumented(ctx, "query"):
+            self._prepare(ctx)
+            if ctx.answer is None:
+                try:
+                    for _ in self._generate(ctx):
+                        pass
+                except CircuitOpenError:
+                    self._degrade(ctx)
+        return ctx.result()
 
-        # Update internal history
-        self.chat_history.append({"role": "user", "content": question})
-        self.chat_history.append({"role": "assistant", "content": answer})
-        self.chat_history = self.chat_history[-self.max_history:]
+    def query_stream(self, question: str, history: list = None,
+                     context: RequestContext = None, client_id: str = None):
+        """Streaming version — yields chunks as they arrive from Ollama.
 
-        return {
-            "answer": answer,
-            "source_documents": source_docs,
-        }
+        Pass a RequestContext to read the sources, token counts and timings
+        once the generator is exhausted.
+        """
+        if not self.qa_chain:
+            yield "System not initialized."
+            return
+
+        ctx = self._new_context(question, history, context, client_id)
+        with self._instrumented(ctx, "stream"):
+            self._prepare(ctx)
+            if ctx.answer is not None:
+                # Replay as tokens so SSE clients can't tell it apart from a live answer
+                yield from _replay_tokens(ctx.answer)
+                return
+            try:
+                yield from self._generate(ctx)
+            except CircuitOpenError:  # raised before any text — nothing streamed yet
+                self._degrade(ctx)
+                yield ctx.answer
+
+    async def aquery(self, question: str, history: list = None, client_id: str = None):
+        """Async query() — retrieval runs on the engine's executor and the
+        answer is streamed from Ollama without holding a thread."""
+        if not self.qa_chain:
+            return self._not_ready_message()
+
+        ctx = self._new_context(question, history, client_id=client_id)
+        with self._instrumented(ctx, "query"):
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._prepare, ctx)
+            if ctx.answer is None:
+                try:
+                    async with aclosing(self._agenerate(ctx)) as stream:
+                        async for _ in stream:
+                            pass
+                except CircuitOpenError:
+                    self._degrade(ctx)
+        return ctx.result()
 
-    def query_stream(self, question: str, history: list = None):
-        """Streaming version — yields chunks as they arrive from Ollama."""
+    async def aquery_stream(self, question: str, history: list = None,
+                            context: RequestContext = None, client_id: str = None):
+        """Async query_stream() — yields chunks as they arrive from Ollama."""
         if not self.qa_chain:
             yield "System not initialized."
             return
 
-        cleaned_question = _expand_slang(question)
-
-        if history:
-            self.chat_history = history[-self.max_history:]
-        chat_history_str = ""
-        if self.chat_history:
-            chat_history_str = "Recent conversation:\n"
-            for msg in self.chat_history:
-                role = "Student" if msg["role"] == "user" else "Assistant"
-                content = msg['content'][:200] if len(msg['content']) > 200 else msg['content']
-                chat_history_str += f"{role}: {content}\n"
-            chat_history_str += "\n"
-
-        source_docs = self.retriever.invoke(cleaned_question)
-        context = _format_docs(source_docs)
+        ctx = self._new_context(question, history, context, client_id)
+        with self._instrumented(ctx, "stream"):
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._prepare, ctx)
+            if ctx.answer is not None:
+                for token in _replay_tokens(ctx.answer):
+                    yield token
+                return
+            try:
+                async with aclosing(self._agenerate(ctx)) as stream:
+                    async for text in stream:
+                        yield text
+            except CircuitOpenError:  # raised before any text — nothing streamed yet
+                self._degrade(ctx)
+                yield ctx.answer
+
+    async def aclose(self):
+        """Stop the health monitor; release the async HTTP pool and the retrieval executor."""
+        self._stop.set()
+        if self.async_llm:
+            await self.async_llm.aclose()
+        self._executor.shutdown(wait=False)
+
+    def queue_stats(self) -> dict:
+        return {**self.scheduler.stats, "coalescing": self.flights.stats}
+
+    def breaker_stats(self) -> dict:
+        return self.breaker.stats
+
+    def add_hook(self, hook):
+        """Attach a hooks.RequestHook (profiler, tracer...) to every query."""
+        self.hooks.append(hook)
+
+    def cache_stats(self) -> dict:
+        stats = {"response": self.response_cache.stats, "semantic": self.answer_cache.stats}
+        if self.retrieval_cache:
+            stats["retrieval"] = self.retrieval_cache.stats
+        return stats
+
+    # ── Helpers ────────────────────────────────────────────────
+    def _lookup_answer(self, ctx: RequestContext, cleaned_question):
+        """Check the exact-match cache, then the semantic cache.
+
+        Sets ctx.cache_key and ctx.query_embedding; returns (answer,
+        source_docs) or None. An exact hit skips the encoder, so the
+        embedding stays None in that case.
+        """
+        with ctx.timed("cache_lookup"):
+            ctx.cache_key = ResponseCache.make_key(
+                cleaned_question, ctx.chat_history, ctx.index_version
+            )
+            cached = self.response_cache.get(ctx.cache_key)
+        if cached:
+            return cached
+
+        # Embed once — the vector is shared by the semantic cache and the search.
+        # Follow-ups depend on the conversation, so only standalone questions match.
+        with ctx.timed("embed"):
+            ctx.query_embedding = self.retrieval_cache.embed_query(cleaned_question)
+        if not ctx.chat_history:
+            with ctx.timed("cache_lookup"):
+                cached = self.answer_cache.lookup(ctx.query_embedding, ctx.index_version)
+        return cached
+
+    def _build_prompt(self, cleaned_question, chat_history_str, docs):
+        """Pack retrieved docs into the token budget left after template,
+        history and question, then render the prompt.
+
+        Returns (prompt_text, packed_docs, token breakdown).
+        """
+        budget = NUM_CTX - ANSWER_TOKEN_RESERVE
+        tokens = {
+            "template": count_tokens(RAG_PROMPT.format(context="", question="", chat_history="")),
+            "history": count_tokens(chat_history_str) if chat_history_str else 0,
+            "question": count_tokens(cleaned_question),
+        }
+        packed, tokens["context"] = pack_context(docs, budget - sum(tokens.values()))
+        tokens["total"] = sum(tokens.values())
+        tokens["budget"] = budget
         prompt_text = RAG_PROMPT.format(
-            context=context,
+            context=_format_docs(packed),
             question=cleaned_question,
             chat_history=chat_history_str,
         )
+        return prompt_text, packed, tokens
 
-        # Stream from Ollama — buffer to strip <think> blocks
-        full_answer = ""
-        thinking_done = False
-        for chunk in self.llm.stream(prompt_text):
-            full_answer += chunk
-            # Buffer until we see </think> or confirm no think tags
-            if not thinking_done:
-                if '<think>' not in full_answer:
-                    # No think tags at all — stream directly
-                    thinking_done = True
-                    yield full_answer  # flush buffer
-                elif '</think>' in full_answer:
-                    # Think block complete — extract and yield the answer part
-                    thinking_done = True
-                    after_think = full_answer.split('</think>', 1)[1]
-                    if after_think.strip():
-                        yield after_think
-                    full_answer = after_think  # reset to only the answer part
-                # else: still inside <think> block, keep buffering
-            else:
-                yield chunk
-        
-        # Final cleanup
-        full_answer = _strip_think(full_answer)
+    @staticmethod
+    def _new_context(question, history, context=None, client_id=None):
+        ctx = context or RequestContext(question)
+        ctx.question = question
+        ctx.history = list(history or ctx.history)[-MAX_HISTORY:]
+        if client_id:
+            ctx.client_id = client_id
+        return ctx
 
-        # Update history after streaming completes
-        self.chat_history.append({"role": "user", "content": question})
-        self.chat_history.append({"role": "assistant", "content": full_answer})
-        self.chat_history = self.chat_history[-self.max_history:]
+    def _prepare(self, ctx: RequestContext):
+        """Everything before generation: slang expansion, history, cache lookup,
+        retrieval and prompt packing.
 
-        # Attach source docs to a special attribute for the caller
-        self._last_source_docs = source_docs
+        Blocking (encoder, Chroma, SQLite) — the async path runs it on the
+        executor. On a cache hit ctx.answer is already set, otherwise
+        ctx.prompt is ready for the LLM.
+        """
+        # Expand slang/abbreviations so retrieval finds the right docs
+        with ctx.timed("slang"):
+            cleaned_question = _expand_slang(ctx.question)
+        with ctx.timed("history"):
+            ctx.chat_history = format_history(ctx.history, HISTORY_TOKEN_BUDGET)
 
-    @property
-    def last_source_docs(self):
-        return getattr(self, '_last_source_docs', [])
+        ctx.index_version = read_index_version(CHROMA_PATH)
+        cached = self._lookup_answer(ctx, cleaned_question)
+        if cached:
+            ctx.answer, ctx.source_documents = cached
+            ctx.cached = True
+            return
+
+        with ctx.timed("retrieval"):
+            source_docs, ctx.context_stats = self.hybrid_retriever.search(
+                cleaned_question, ctx.query_embedding
+            )
+        with ctx.timed("prompt_build"):
+            ctx.prompt, ctx.source_documents, ctx.prompt_tokens = self._build_prompt(
+                cleaned_question, ctx.chat_history, source_docs
+            )
+
+    # ── Generation ─────────────────────────────────────────────
+    # Identical questions (same normalized text, history and index version —
+    # i.e. the same cache key) that arrive while one is generating attach to
+    # it instead of queueing a second, identical generation.
+    def _generate(self, ctx: RequestContext):
+        """Yield the answer to ctx as Ollama produces it (sync path)."""
+        flight, leader = self.flights.join(ctx.cache_key)
+        if not leader:
+            ctx.coalesced = True
+            try:
+                with ctx.timed("generation"):
+                    for text in flight:
+                        ctx.first_token()
+                        yield text
+            finally:
+                self.flights.leave(flight)
+            ctx.answer = flight.answer
+            return
+
+        stripper = _ThinkFilter()
+        detached = False  # our caller stopped reading; finishing for the followers
+        try:
+            self._check_breaker(claim=False)  # don't queue for an LLM known to be down
+            with self.scheduler.slot(ctx.client_id) as waited:
+                ctx.record("queue_wait", waited)
+                # The breaker may have tripped while this request was queued
+                self._check_breaker()
+                # Call the LLM directly (not via chain — avoids double retrieval);
+                # <think> blocks are filtered out as the chunks arrive
+                with ctx.timed("generation"):
+                    config = {"callbacks": [_EvalStats(ctx)]}
+                    for text in stripper.filter(self.llm.stream(ctx.prompt, config=config)):
+                        flight.publish(text)
+                        if detached:
+                            continue
+                        ctx.first_token()
+                        try:
+                            yield text
+                        except GeneratorExit:
+                            if self.flights.leave(flight):
+                                raise  # nobody else is waiting for this answer
+                            detached = True
+            ctx.completion_tokens = stripper.chunks
+            self.breaker.record_success()
+            ctx.answer = stripper.result()
+            self._store_answer(ctx)
+            self.flights.complete(flight)
+            flight.finish(ctx.answer)
+        except BaseException as e:
+            self._record_failure(e)
+            self.flights.complete(flight)
+            flight.fail(e)
+            raise
+
+    async def _agenerate(self, ctx: RequestContext):
+        """Yield the answer to ctx as Ollama produces it (async path).
+
+        The leader's generation runs as its own task, so a client that
+        disconnects doesn't cut off the others; it is cancelled only when
+        every attached client has gone.
+        """
+        flight, leader = self.flights.join(ctx.cache_key)
+        if leader:
+            flight.task = asyncio.create_task(self._produce(ctx, flight))
+        else:
+            ctx.coalesced = True
+        start = time.perf_counter()
+        try:
+            async for text in flight:
+                ctx.first_token()
+                yield text
+        finally:
+            self.flights.leave(flight)
+        if not leader:
+            ctx.record("generation", time.perf_counter() - start)
+        ctx.answer = flight.answer
+
+    async def _produce(self, ctx: RequestContext, flight):
+        stripper = _ThinkFilter()
+        try:
+            self._check_breaker(claim=False)  # don't queue for an LLM known to be down
+            async with self.scheduler.aslot(ctx.client_id) as waited:
+                ctx.record("queue_wait", waited)
+                # The breaker may have tripped while this request was queued
+                self._check_breaker()
+                with ctx.timed("generation"):
+                    chunks = self.async_llm.stream(ctx.prompt, stats=ctx.llm_stats)
+                    async for text in stripper.afilter(chunks):
+                        flight.publish(text)
+            ctx.completion_tokens = stripper.chunks
+            self.breaker.record_success()
+            ctx.answer = stripper.result()
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._store_answer, ctx
+            )
+            self.flights.complete(flight)
+            flight.finish(ctx.answer)
+        except BaseException as e:
+            # Subscribers re-raise it; the task itself only propagates cancellation
+            self._record_failure(e)
+            self.flights.complete(flight)
+            flight.fail(e)
+            if not isinstance(e, Exception):
+                raise
+
+    # ── Instrumentation ────────────────────────────────────────
+    @contextmanager
+    def _instrumented(self, ctx: RequestContext, kind: str):
+        """Count the request, run the hooks around it and feed its stage
+        timings to the metrics when it ends."""
+        REQUESTS.inc(kind=kind)
+        if kind == "stream":
+            INFLIGHT_STREAMS.inc()
+        self._run_hooks("on_start", ctx)
+        error = None
+        try:
+            yield
+        except QueueFullError as e:
+            error = e
+            QUEUE_REJECTIONS.inc()
+            raise
+        except Exception as e:
+            error = e
+            ERRORS.inc(error=type(e).__name__)
+            raise
+        finally:
+            if kind == "stream":
+                INFLIGHT_STREAMS.dec()
+            _observe(ctx)
+            self._run_hooks("on_finish", ctx, error)
+
+    def _run_hooks(self, method: str, *args):
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(*args)
+            except Exception as e:
+                print(f"[RAG] {type(hook).__name__}.{method} failed: {e}")
+
+    def _check_breaker(self, claim: bool = True):
+        if not self.breaker.allow(claim):
+            raise CircuitOpenError(f"LLM unavailable: {self.breaker.last_error}")
+
+    def _record_failure(self, error: BaseException):
+        if isinstance(error, CircuitOpenError):
+            return
+        if isinstance(error, _LLM_UNAVAILABLE):
+            self.breaker.record_failure(error)
+        else:
+            self.breaker.release()  # client left or queue full — says nothing about Ollama
+
+    def _degrade(self, ctx: RequestContext):
+        ctx.degraded = True
+        ctx.answer = _degraded_answer(ctx.source_documents)
+
+    def _store_answer(self, ctx: RequestContext):
+        if not ctx.answer:
+            return
+        self.response_cache.put(ctx.cache_key, ctx.answer, ctx.source_documents, ctx.index_version)
+        if not ctx.chat_history:
+            self.answer_cache.store(
+                ctx.query_embedding, ctx.answer, ctx.source_documents, ctx.index_version
+            )
+
+    def _not_ready_message(self) -> str:
+        parts = []
+        if not self.status["db"]:
+            parts.append("Vector database not found — run 'python ingest.py' first.")
+        if not self.status["ollama"]:
+            parts.append("Ollama is not running — start it with 'ollama serve'.")
+        return " | ".join(parts) if parts else "System not initialized."
+
+    def warm_up(self) -> float:
+        """Load the model and prefill RAG_SYSTEM_PROMPT so the first real
+        question skips the model load and reuses the cached prefix.
+
+        Uses the same options as real requests — a different num_ctx would
+        make Ollama reload the model. Returns the seconds it took.
+        """
+        start = time.perf_counter()
+        r = requests.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={
+                "model": LLM_MODEL,
+                "prompt": RAG_SYSTEM_PROMPT,
+                "stream": False,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": {**LLM_OPTIONS, "num_predict": 1},
+            },
+            timeout=OLLAMA_TIMEOUT,
+        )
+        r.raise_for_status()
+        return time.perf_counter() - start
+
+    def _warm_up_quietly(self):
+        try:
+            seconds = self.warm_up()
+            self.components["ollama"]["timings"]["warmup"] = round(seconds, 2)
+            print(f"[RAG] Model warm ({seconds:.1f}s, keep_alive={OLLAMA_KEEP_ALIVE})")
+        except Exception as e:
+            print(f"[RAG] Warm-up failed: {e}")
+
+    def _monitor_ollama(self):
+        """Re-probe Ollama in the background and flip status as it comes and goes."""
+        while not self._stop.wait(OLLAMA_MONITOR_INTERVAL):
+            try:
+                r = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=OLLAMA_PROBE_TIMEOUT)
+                up = r.status_code == 200
+            except requests.RequestException:
+                up = False
+            if up and self.llm is None:
+                self._connect_ollama()
+                self._build_chain()
+                if self.status["ready"]:
+                    print("[RAG] Ollama is up — engine ready")
+                continue
+            if up != self.status["ollama"]:
+                print(f"[RAG] Ollama {'is back' if up else 'stopped responding'}")
+            self.status["ollama"] = up
+            self.components["ollama"].update(
+                ready=up, error=None if up else f"Health probe failed ({OLLAMA_BASE_URL})"
+            )
+            if not up and self.llm is not None:
+                self.breaker.trip(f"health probe failed ({OLLAMA_BASE_URL})")
 
-    # ── Helpers ────────────────────────────────────────────────
     @staticmethod
     def _ollama_is_running() -> bool:
         try:
@@ -0,0 +1,219 @@
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+class QueueFullError(Exception):
+    """Raised when a request can't be queued (or waited too long) for the LLM."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("client_id", "enqueued_at", "granted", "event", "future", "loop")
+
+    def __init__(self, client_id, event=None, future=None, loop=None):
+        self.client_id = client_id
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.event = event      # sync callers block on a threading.Event
+        self.future = future    # async callers await a future on their loop
+        self.loop = loop
+
+    def wake(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# ── LLM scheduler ──────────────────────────────────────────────
+class LLMScheduler:
+    """Concurrency limit + bounded, per-client fair wait queue for generation.
+
+    At most `max_concurrent` generations run at once. Waiting requests are
+    grouped by client and served round-robin, so one client with many queued
+    requests takes a turn like everyone else instead of blocking them. A
+    request is rejected with QueueFullError when `max_queue` requests are
+    already waiting, when its client already has `max_per_client` waiting, or
+    when it has waited `timeout` seconds. Sync (threads) and async (event
+    loop) callers share the same queue.
+    """
+
+    def __init__(self, max_concurrent: int = 1, max_queue: int = 16,
+                 max_per_client: int = 4, timeout: float = 120):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.timeout = timeout
+        self.counters = {"admitted": 0, "rejected": 0, "timed_out": 0}
+        self._active = 0
+        self._queued = 0
+        self._queues = OrderedDict()  # client ID -> deque of waiters, in serving order
+        self._waits = deque(maxlen=1000)  # recent queue waits (seconds)
+        self._avg_hold = None  # moving average of how long a generation holds a slot
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, client_id: str):
+        """Hold a generation slot for the duration of the block (blocking wait).
+
+        Yields the seconds spent waiting in the queue.
+        """
+        waited = self.acquire(client_id)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self, client_id: str):
+        """Async slot() — waits on the event loop without holding a thread."""
+        waited = await self.acquire_async(client_id)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(time.monotonic() - start)
+
+    def acquire(self, client_id: str):
+        with self._lock:
+            if self._try_admit():
+                return 0.0
+            waiter = self._enqueue(_Waiter(client_id, event=threading.Event()))
+        if not waiter.event.wait(self.timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._drop(waiter)
+                    raise self._timed_out()
+        return self._record_wait(waiter)
+
+    async def acquire_async(self, client_id: str):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_admit():
+                return 0.0
+            waiter = self._enqueue(_Waiter(client_id, future=loop.create_future(), loop=loop))
+        try:
+            await asyncio.wait_for(waiter.future, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.granted:
+                    # Granted just as we gave up — hand the slot on
+                    self._active -= 1
+                    self._grant_next()
+                else:
+                    self._drop(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._timed_out() from None
+            raise
+        return self._record_wait(waiter)
+
+    def check(self, client_id: str):
+        """Raise QueueFullError now if a request from `client_id` would be rejected.
+
+        Lets the API refuse a stream before its response headers are sent;
+        the real admission still happens when generation starts. A refusal
+        here counts as a rejection — the request never gets that far.
+        """
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queued:
+                return
+            self._check_capacity(client_id)
+
+    @property
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._queued,
+                "clients_waiting": len(self._queues),
+                **self.counters,
+                "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                "wait_ms_p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else 0.0,
+                "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+            }
+
+    # ── Internals (call with self._lock held) ──────────────────
+    def _try_admit(self):
+        # Nobody may overtake a queued request, even if a slot looks free
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            self.counters["admitted"] += 1
+            self._waits.append(0.0)
+            return True
+        return False
+
+    def _check_capacity(self, client_id):
+        queued_for_client = len(self._queues.get(client_id, ()))
+        if self._queued >= self.max_queue:
+            reason = f"LLM queue is full ({self._queued} waiting)"
+        elif queued_for_client >= self.max_per_client:
+            reason = f"Too many queued requests from this client ({queued_for_client})"
+        else:
+            return
+        self.counters["rejected"] += 1
+        raise QueueFullError(reason, self._retry_after())
+
+    def _enqueue(self, waiter):
+        self._check_capacity(waiter.client_id)
+        self._queues.setdefault(waiter.client_id, deque()).append(waiter)
+        self._queued += 1
+        return waiter
+
+    def _drop(self, waiter):
+        waiters = self._queues.get(waiter.client_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[waiter.client_id]
+
+    def _grant_next(self):
+        while self._active < self.max_concurrent and self._queues:
+            client_id, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._queues.move_to_end(client_id)  # this client's next turn is after everyone else's
+            else:
+                del self._queues[client_id]
+            waiter.granted = True
+            self._active += 1
+            self.counters["admitted"] += 1
+            waiter.wake()
+
+    def _release(self, held: float):
+        with self._lock:
+            self._avg_hold = held if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held
+            self._active -= 1
+            self._grant_next()
+
+    def _record_wait(self, waiter):
+        waited = time.monotonic() - waiter.enqueued_at
+        with self._lock:
+            self._waits.append(waited)
+        return waited
+
+    def _timed_out(self):
+        self.counters["timed_out"] += 1
+        return QueueFullError(f"Waited over {self.timeout:.0f}s for the LLM", self._retry_after())
+
+    def _retry_after(self) -> int:
+        """Estimated wait for a request joining the back of the queue now."""
+        hold = self._avg_hold if self._avg_hold is not None else 10.0
+        return max(1, math.ceil(hold * (self._queued + 1) / self.max_concurrent))
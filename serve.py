@@ -0,0 +1,203 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+
+# Set HuggingFace to offline mode before importing rag_engine
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import uvicorn
+
+import rag_engine
+
+# ── Production server ──────────────────────────────────────────
+# Pre-fork: the parent loads the embedding model, BM25 index, tokenizer,
+# libraries and (NumPy backend) the mapped vector export once, binds the
+# listening socket, then forks worker processes that each run uvicorn on that
+# socket. Read-only pages stay shared copy-on-write, so a worker costs its own
+# Chroma client, caches and request state — not another copy of the model. `python api.py` remains the dev server (reload).
+DEFAULT_BIND = "0.0.0.0:8000"
+DEFAULT_WORKERS = os.cpu_count() or 1
+GRACEFUL_TIMEOUT = 30   # seconds workers get to finish in-flight requests
+BACKLOG = 2048
+MIN_WORKER_UPTIME = 5   # a worker dying sooner than this is a startup failure, not respawned
+
+
+def parse_bind(bind: str):
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def listen(bind: str) -> socket.socket:
+    host, port = parse_bind(bind)
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, args):
+    """Child process: serve api.app on the inherited socket until SIGTERM/SIGINT."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if args.threads:
+        # N workers each defaulting to every core would oversubscribe the CPU
+        import torch
+        torch.set_num_threads(args.threads)
+    import api
+    config = uvicorn.Config(
+        api.app,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    """Forks the workers, replaces ones that die, and shuts them down on
+    SIGTERM/SIGINT: SIGTERM to every worker (uvicorn stops accepting and
+    drains), SIGKILL to any still running after the graceful timeout."""
+
+    def __init__(self, sock: socket.socket, args):
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # Own process group: a terminal Ctrl+C reaches only the master, which
+            # then stops each worker once (a second signal makes uvicorn skip draining)
+            os.setpgid(0, 0)
+            code = 0
+            try:
+                run_worker(self.sock, self.args)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        print(f"[Serve] Worker {pid} started")
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            print(f"[Serve] {signal.Signals(signum).name} — shutting down {len(self.workers)} worker(s)")
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.args.workers):
+            self.spawn()
+        while not self.stopping:
+            time.sleep(0.5)
+            for pid, status in self.reap():
+                started = self.workers.pop(pid)
+                print(f"[Serve] Worker {pid} exited ({describe(status)})")
+                if self.stopping:
+                    continue
+                if time.monotonic() - started < MIN_WORKER_UPTIME:
+                    print("[Serve] Worker failed during startup — stopping")
+                    self.stopping = True
+                else:
+                    self.spawn()
+        self.shutdown()
+
+    def shutdown(self):
+        for pid in self.workers:
+            _signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            for pid, _ in self.reap():
+                self.workers.pop(pid, None)
+            time.sleep(0.1)
+        for pid in self.workers:
+            print(f"[Serve] Worker {pid} did not stop in time — killing")
+            _signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.sock.close()
+        print("[Serve] Stopped.")
+
+    def reap(self):
+        """(pid, status) of workers that have exited since the last call."""
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.workers:
+                exited.append((pid, status))
+        return exited
+
+
+def describe(status: int) -> str:
+    if os.WIFSIGNALED(status):
+        return f"signal {signal.Signals(os.WTERMSIG(status)).name}"
+    return f"exit code {os.WEXITSTATUS(status)}"
+
+
+def _signal(pid: int, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the KRMAI API with pre-forked worker processes.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"worker processes (default: one per CPU = {DEFAULT_WORKERS})")
+    parser.add_argument("--bind", default=DEFAULT_BIND, help="host:port to listen on")
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT,
+                        help="seconds to finish in-flight requests on shutdown")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads per worker (default: CPUs / workers)")
+    parser.add_argument("--keep-alive", type=int, default=5, help="idle keep-alive timeout (s)")
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="load models in each worker instead of once in the parent")
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    if args.threads is None:
+        args.threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    print(f"{'=' * 50}")
+    print(f"  KRMAI API — {args.workers} worker(s) on {args.bind}")
+    print(f"{'=' * 50}")
+    if not hasattr(os, "fork"):
+        # Windows: no fork, so no sharing — run one process without the reloader
+        print("[Serve] os.fork is unavailable on this platform — running a single worker")
+        host, port = parse_bind(args.bind)
+        uvicorn.run("api:app", host=host, port=port, log_level=args.log_level,
+                    timeout_graceful_shutdown=args.graceful_timeout)
+        return
+
+    if not args.no_preload:
+        print(f"[Serve] Preloading models in the parent ({rag_engine.EMBEDDING_MODEL})...")
+        print(f"[Serve] Preloaded in {rag_engine.preload():.2f}s")
+    import api  # noqa: F401 — imported once here, shared by the workers
+    # Everything loaded so far lives for the life of the process: move it out
+    # of the collector's reach so a gc pass in a worker doesn't touch (and
+    # thereby copy) every shared page.
+    gc.collect()
+    gc.freeze()
+
+    sock = listen(args.bind)
+    Master(sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+
+
+# ── Shared in-flight generations ───────────────────────────────
+class Flight:
+    """One generation shared by every identical request that arrives while it runs.
+
+    The producer publishes text chunks; subscribers iterate them (sync with
+    `for`, async with `async for`). Chunks are kept for the flight's lifetime,
+    so a late joiner first receives everything produced so far.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.tokens = []
+        self.answer = None
+        self.error = None
+        self.done = False
+        self.subscribers = 1  # the request that started it
+        self.task = None      # async producer, cancelled if every subscriber leaves
+        self._cond = threading.Condition()
+        self._waiters = set()  # (loop, asyncio.Event) per async subscriber
+
+    def publish(self, text: str):
+        with self._cond:
+            self.tokens.append(text)
+            self._notify()
+
+    def finish(self, answer: str):
+        with self._cond:
+            if not self.tokens and answer:
+                self.tokens.append(answer)  # producer didn't stream — deliver it whole
+            self.answer = answer
+            self.done = True
+            self._notify()
+
+    def fail(self, error: BaseException):
+        with self._cond:
+            self.error = error
+            self.done = True
+            self._notify()
+
+    def __iter__(self):
+        sent = 0
+        while True:
+            with self._cond:
+                while sent >= len(self.tokens) and not self.done:
+                    self._cond.wait()
+                new, done = self.tokens[sent:], self.done
+            sent += len(new)
+            yield from new
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+    async def __aiter__(self):
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            self._waiters.add(waiter)
+        try:
+            sent = 0
+            while True:
+                with self._cond:
+                    new, done = self.tokens[sent:], self.done
+                    if not new and not done:
+                        # Cleared under the lock, so a publish after this point
+                        # schedules a set() that runs after it
+                        event.clear()
+                if not new and not done:
+                    await event.wait()
+                    continue
+                sent += len(new)
+                for text in new:
+                    yield text
+                if done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # subscriber's loop already closed
+                pass
+
+
+class SingleFlight:
+    """Registry of in-flight generations keyed by request identity.
+
+    join() returns the running flight for a key (follower) or starts a new
+    one (leader). A flight leaves the registry once complete(); a flight
+    whose subscribers all left early is dropped so nobody new joins it.
+    """
+
+    def __init__(self):
+        self.counters = {"leaders": 0, "followers": 0}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str):
+        """Return (flight, is_leader)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                self.counters["followers"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            self.counters["leaders"] += 1
+            return flight, True
+
+    def leave(self, flight: Flight) -> bool:
+        """Drop one subscriber. Returns True if that abandons an unfinished flight."""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.done:
+                return False
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if flight.task is not None:
+            flight.task.get_loop().call_soon_threadsafe(flight.task.cancel)
+        return True
+
+    def complete(self, flight: Flight):
+        """Stop new requests joining; call before finish()/fail()."""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), **self.counters}
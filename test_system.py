@@ -16,6 +16,7 @@ import sys
 import time
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import Optional
 
@@ -334,6 +335,125 @@ def test_response_time():
     return passed, f"Response time: {duration:.1f}s", answer
 
 
+# =====================================================================
+# SECTION 8: Concurrency Tests
+# =====================================================================
+# (question, substring expected in a cited source file name)
+CONCURRENT_CASES = [
+    ("What are the bus routes available at KR Mangalam University?", "bus"),
+    ("What are the hostel facilities at KRMU?", "hostel"),
+    ("How can I apply for scholarships at KR Mangalam University?", "scholarship"),
+    ("What is the anti-ragging policy at KRMU?", "ragging"),
+    ("Tell me about placements at KRMU. What is the highest package?", "placement"),
+]
+
+
+def stream_query(question, history=None, timeout=300):
+    """Send a query to /chat/stream and return (answer, done event)."""
+    r = requests.post(
+        f"{API_URL}/chat/stream",
+        json={"message": question, "history": history},
+        stream=True,
+        timeout=timeout,
+    )
+    if r.status_code != 200:
+        raise Exception(f"API error {r.status_code}: {r.text}")
+    answer, done = "", None
+    for line in r.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data: "):
+            continue
+        payload = json.loads(line[6:])
+        if payload["type"] == "token":
+            answer += payload["content"]
+        elif payload["type"] == "done":
+            done = payload
+    return answer, done
+
+
+def test_concurrent_streams_isolated():
+    """Parallel streams must each cite their own topic's sources, and only the
+    requests that sent history may have history in their prompt."""
+    jobs = []
+    for i, (question, topic) in enumerate(CONCURRENT_CASES):
+        # Every other request carries a conversation; the rest start fresh
+        history = None
+        if i % 2:
+            history = [
+                {"role": "user", "content": f"I am asking about {topic} for my cousin."},
+                {"role": "assistant", "content": f"Sure, ask me anything about {topic}."},
+            ]
+        jobs.append((question, topic, history))
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        outcomes = list(pool.map(lambda job: stream_query(job[0], job[2]), jobs))
+
+    problems = []
+    for (question, topic, history), (answer, done) in zip(jobs, outcomes):
+        if done is None:
+            problems.append(f"{topic}: no done event")
+            continue
+        sources = [s["source"].lower() for s in done.get("sources", [])]
+        if not any(topic in s for s in sources):
+            problems.append(f"{topic}: sources {sources}")
+        tokens = done.get("tokens")  # None when answered from cache
+        if tokens is not None and bool(tokens.get("history")) != bool(history):
+            problems.append(f"{topic}: history tokens {tokens.get('history')}")
+    details = f"{len(jobs)} parallel streams"
+    if problems:
+        return False, f"{details}, mixed up: {problems}", ""
+    return True, f"{details}, sources and history isolated", ""
+
+
+# =====================================================================
+# SECTION 9: Context Packing (offline — no API or Ollama needed)
+# =====================================================================
+class _FakeRetrievalCache:
+    """Stands in for RetrievalCache: fixed ranking, embeddings and documents."""
+
+    def __init__(self, docs, vectors):
+        self.docs = {d.id: d for d in docs}
+        self.ranking = docs
+        self.vectors = dict(zip(self.docs, vectors))
+
+    def search(self, query_embedding):
+        return self.ranking
+
+    def get_documents(self, ids):
+        return [self.docs[i] for i in ids]
+
+    def get_embeddings(self, ids):
+        import numpy as np
+        return np.array([self.vectors[i] for i in ids], dtype=float)
+
+
+def test_context_savings():
+    """chars_saved counts only what left the chosen chunks: the overlap
+    stripped from B, plus D, an exact copy of A that MMR skips."""
+    import tempfile
+    from langchain_core.documents import Document
+    from rag_engine import HybridRetriever
+
+    text = "".join(f"w{i:04d}," for i in range(500))  # no whitespace to trim
+    docs = [
+        Document(id="a", page_content=text[:1500], metadata={"source": "a.pdf"}),
+        Document(id="b", page_content=text[1200:2700], metadata={"source": "a.pdf"}),  # 300 shared
+        Document(id="c", page_content="Hostel rooms are allotted by the warden. " * 10,
+                 metadata={"source": "hostel.pdf"}),
+        Document(id="d", page_content=text[:1500], metadata={"source": "a-copy.pdf"}),
+    ]
+    vectors = [[1, 0, 0], [0.6, 0.8, 0], [0, 0, 1], [1, 0, 0]]
+    retriever = HybridRetriever(_FakeRetrievalCache(docs, vectors), tempfile.mkdtemp(),
+                                k=4, lexical_weight=0)
+    selected, stats = retriever.search("fees", [1, 0, 0])
+
+    stripped = sum(len(d.page_content) for d in docs[:3]) - sum(len(d.page_content) for d in selected)
+    expected = {"chars_stripped": 300, "chars_duplicate": 1500, "chars_saved": 1800}
+    actual = {key: stats[key] for key in expected}
+    passed = (stats["chars_saved"] >= 0 and stripped == stats["chars_stripped"]
+              and actual == expected and sorted(d.id for d in selected) == ["a", "b", "c"])
+    return passed, f"Stats: {actual}, stripped: {stripped}, kept: {[d.id for d in selected]}", ""
+
+
 # =====================================================================
 # RUNNER
 # =====================================================================
@@ -390,6 +510,10 @@ def main():
     print("  KRMU Knowledge Retrieval System — Comprehensive Test Suite")
     print("=" * 70)
 
+    # ── 0. Offline checks ──
+    print("\n  --- Context Packing ---")
+    run_test("Context Savings Non-Negative", "Context Packing", test_context_savings)
+
     # ── 1. Infrastructure ──
     print("\n  --- Infrastructure Tests ---")
     infra_ok = True
@@ -444,6 +568,10 @@ def main():
     print("\n  --- Performance ---")
     run_test("Response Time < 60s", "Performance", test_response_time)
 
+    # ── 8. Concurrency ──
+    print("\n  --- Concurrency ---")
+    run_test("Parallel Streams Isolated", "Concurrency", test_concurrent_streams_isolated)
+
     print_report()
 
 
@@ -0,0 +1,257 @@
+import os
+import glob
+import json
+import uuid
+import threading
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from cache import read_index_version
+
+# Written by ingest.py into chroma_db/, next to the Chroma data. The sidecar
+# names the matrix file; every export writes a new one, because a file that
+# a running engine has memory-mapped can't be replaced on Windows.
+VECTORS_META_FILE = "vectors_meta.json"  # matrix file name + [id, text, metadata] per row
+VECTORS_PATTERN = "vectors-*.npy"        # float32 (chunks, dim) matrices, memory-mapped
+
+
+def save_vectors(directory: str, pages, count: int):
+    """Write a new embedding matrix, then point the sidecar at it atomically.
+
+    `pages` yields (ids, embeddings, documents, metadatas) for `count` chunks
+    in all; each page is written out before the next is read, so memory use
+    doesn't grow with the corpus.
+    """
+    name = VECTORS_PATTERN.replace("*", uuid.uuid4().hex[:12])
+    matrix_path = os.path.join(directory, name)
+    meta_path = os.path.join(directory, VECTORS_META_FILE)
+    matrix, rows = None, 0
+    try:
+        with open(meta_path + ".tmp", "w") as meta:
+            meta.write(f'{{"matrix":{json.dumps(name)},"rows":[')
+            for ids, embeddings, documents, metadatas in pages:
+                if not len(ids):
+                    continue
+                block = np.asarray(embeddings, dtype=np.float32)
+                if matrix is None:
+                    matrix = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.float32,
+                                                       shape=(count, block.shape[1]))
+                if rows + len(ids) > count:
+                    raise ValueError(f"more than the {count} chunks expected")
+                matrix[rows:rows + len(ids)] = block
+                for doc_id, document, metadata in zip(ids, documents, metadatas):
+                    meta.write(("," if rows else "")
+                               + json.dumps([doc_id, document, metadata or {}], separators=(",", ":")))
+                    rows += 1
+            meta.write("]}")
+        if rows != count:
+            raise ValueError(f"{rows} chunks read, {count} expected")
+        if matrix is None:
+            np.save(matrix_path, np.zeros((0, 0), dtype=np.float32))
+            nbytes = 0
+        else:
+            matrix.flush()
+            nbytes = matrix.nbytes
+            del matrix  # unmap before anything may replace it
+    except BaseException:
+        for path in (matrix_path, meta_path + ".tmp"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    os.replace(meta_path + ".tmp", meta_path)
+    # Older matrices; one still mapped by an engine (Windows) goes on the next export
+    for path in glob.glob(os.path.join(directory, VECTORS_PATTERN)):
+        if os.path.basename(path) != name:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return nbytes
+
+
+class _Query:
+    __slots__ = ("vector", "k", "result", "error", "leader", "ready")
+
+    def __init__(self, vector, k):
+        self.vector = vector
+        self.k = k
+        self.result = None
+        self.error = None
+        self.leader = False
+        self.ready = threading.Event()
+
+
+class NumpyVectorStore:
+    """Read-only, exact vector store over ingest.py's memory-mapped export.
+
+    Not a LangChain VectorStore: there is nothing to add or delete here —
+    ingest.py writes Chroma and re-exports. It offers the search and lookup
+    calls RAGEngine makes on Chroma, plus as_retriever() for the LCEL chain.
+
+    A query is one matrix-vector product over every chunk, ranked by L2
+    distance like Chroma's default space, with no client, SQLite or HNSW
+    layer in between. Concurrent searches are batched: while one thread runs
+    a product, queries arriving meanwhile queue up and the next of them runs
+    them all as a single matrix-matrix product. The export is reloaded when
+    ingest.py bumps the index version.
+    """
+
+    def __init__(self, directory: str, embedding=None):
+        self.directory = directory
+        self._embedding = embedding
+        self._data = None     # (matrix, squared norms, ids, documents, metadatas, id -> row)
+        self._version = None
+        self._load_lock = threading.Lock()
+        self._queue = []
+        self._busy = False
+        self._lock = threading.Lock()
+        self._check_version()
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        try:
+            with open(os.path.join(directory, VECTORS_META_FILE)) as f:
+                meta = json.load(f)
+            name = meta["matrix"]
+        except (OSError, ValueError, KeyError):
+            return False
+        if "rows" not in meta:
+            return False  # older sidecar layout — ingest.py re-exports it
+        return os.path.exists(os.path.join(directory, name))
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    # ── Search ─────────────────────────────────────────────────
+    def search_batch(self, embeddings, k: int, data=None):
+        """Top-k (row, squared L2 distance) lists, best first, for each query vector."""
+        matrix, norms = (data or self._check_version())[:2]
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        k = min(k, len(norms))
+        if k <= 0:
+            return [[] for _ in queries]
+        # ||q - x||² = ||q||² - 2 q·x + ||x||²
+        distances = norms[None, :] - 2 * (queries @ matrix.T)
+        distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(distances, top):
+            order = candidates[np.argsort(row[candidates], kind="stable")]
+            results.append([(int(i), float(row[i])) for i in order])
+        return results
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs):
+        data, hits = self._submit(embedding, k)
+        return [(self._document(data, row), distance) for row, distance in hits]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def as_retriever(self, search_kwargs=None):
+        return NumpyRetriever(store=self, k=(search_kwargs or {}).get("k", 4))
+
+    def _submit(self, embedding, k: int):
+        """Run one query, sharing a matrix product with any that arrive meanwhile.
+        Returns the loaded export it ran against and its (row, distance) list."""
+        query = _Query(np.asarray(embedding, dtype=np.float32), k)
+        with self._lock:
+            self._queue.append(query)
+            if not self._busy:
+                self._busy = query.leader = True
+        if not query.leader:
+            query.ready.wait()  # answered, or promoted to run the next batch
+        if query.leader:
+            self._run_batch()
+        if query.error is not None:
+            raise query.error
+        return query.result
+
+    def _run_batch(self):
+        with self._lock:
+            batch, self._queue = self._queue, []
+        try:
+            data = self._check_version()
+            results = self.search_batch(np.stack([q.vector for q in batch]),
+                                        max(q.k for q in batch), data)
+            for query, result in zip(batch, results):
+                query.result = data, result[:query.k]
+        except Exception as e:
+            for query in batch:
+                query.error = e
+        with self._lock:
+            if self._queue:
+                self._queue[0].leader = True
+                self._queue[0].ready.set()
+            else:
+                self._busy = False
+        for query in batch:
+            query.ready.set()
+
+    # ── Lookup (the parts of Chroma's API the engine uses) ─────
+    def get_by_ids(self, ids):
+        data = self._check_version()
+        return [self._document(data, data[5][i]) for i in ids if i in data[5]]
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        data = self._check_version()
+        matrix, _, all_ids, documents, metadatas, rows = data
+        positions = range(len(all_ids)) if ids is None else [rows[i] for i in ids if i in rows]
+        result = {"ids": [all_ids[p] for p in positions]}
+        if "embeddings" in include:
+            result["embeddings"] = [matrix[p] for p in positions]
+        if "documents" in include:
+            result["documents"] = [documents[p] for p in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [metadatas[p] for p in positions]
+        return result
+
+    # ── Loading ────────────────────────────────────────────────
+    @staticmethod
+    def _document(data, row):
+        return Document(id=data[2][row], page_content=data[3][row], metadata=dict(data[4][row]))
+
+    def _check_version(self):
+        version = read_index_version(self.directory)
+        with self._load_lock:
+            if self._data is None or version != self._version:
+                self._data = self._load()
+                self._version = version
+            return self._data
+
+    def _load(self, retry: bool = True):
+        with open(os.path.join(self.directory, VECTORS_META_FILE)) as f:
+            meta = json.load(f)
+        try:
+            matrix = np.load(os.path.join(self.directory, meta["matrix"]), mmap_mode="r")
+        except FileNotFoundError:
+            if not retry:
+                raise
+            return self._load(retry=False)  # an export replaced it between the two reads
+        ids, documents, metadatas = (list(column) for column in zip(*meta["rows"])) if meta["rows"] else ([], [], [])
+        if len(ids) != len(matrix):
+            raise ValueError(f"{meta['matrix']} has {len(matrix)} rows but {VECTORS_META_FILE} "
+                             f"has {len(ids)} — re-run ingest.py")
+        norms = np.einsum("ij,ij->i", matrix, matrix)
+        return matrix, norms, ids, documents, metadatas, {i: n for n, i in enumerate(ids)}
+
+
+class NumpyRetriever(BaseRetriever):
+    """LangChain retriever over a NumpyVectorStore (what as_retriever() returns)."""
+
+    store: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        return self.store.similarity_search(query, k=self.k)